@@ -1,51 +1,262 @@
-from flask import Flask, render_template, redirect, url_for, request, flash, session, make_response
+from flask import Flask, Blueprint, abort, current_app, g, has_request_context, render_template, redirect, url_for, request, flash, session, make_response, jsonify, send_from_directory, stream_with_context, Response
 from flask_sqlalchemy import SQLAlchemy
-from flask_login import LoginManager, login_user, logout_user, login_required, UserMixin
-from flask_socketio import SocketIO
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateColumn
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import joinedload, selectinload
+from flask_login import LoginManager, login_user, logout_user, login_required, UserMixin, current_user
+from flask_socketio import SocketIO, join_room, emit
+from markupsafe import Markup
+import click
 import pdfkit
 import os
-import qrcode
+import io
+import csv
+import json
+import codecs
+import zipfile
+import tempfile
+import contextlib
+import uuid
+import time
+import functools
+import sqlite3
+import shutil
+import hashlib
+import hmac
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from collections import namedtuple
+from werkzeug.local import LocalProxy
+from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
-from datetime import datetime
+from datetime import datetime, timedelta
 import pytz
+import receipt
+import table_qr
+import cart_store
+import product_images
+import product_search
+import catalog_io
+import socketio_queue
+import metrics
+from config import Config
 
 # -------------------- Flask App --------------------
-app = Flask(__name__)
-app.config['SECRET_KEY'] = 'your-secret-key'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///restaurant.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-# Upload folders
-UPLOAD_FOLDER = os.path.join(app.static_folder, 'images')
-QRCODE_FOLDER = os.path.join(app.static_folder, 'qrcodes')
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-os.makedirs(QRCODE_FOLDER, exist_ok=True)
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['QRCODE_FOLDER'] = QRCODE_FOLDER
-
-# LAN Host for QR
-BASE_HOST_FOR_QR = "http://192.168.29.118:5000"
-
-# DB
-db = SQLAlchemy(app)
-
-# SocketIO
-socketio = SocketIO(app, cors_allowed_origins="*")
-
-# Login
+class InstrumentedSocketIO(SocketIO):
+    # flask_socketio.emit() inside handlers ends up here as well
+    def emit(self, event, *args, **kwargs):
+        socketio_emits.inc(event)
+        return super().emit(event, *args, **kwargs)
+
+db = SQLAlchemy()
+socketio = InstrumentedSocketIO()
 login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'admin_login'
+login_manager.login_view = 'main.admin_login'
+bp = Blueprint('main', __name__, cli_group=None)
+
+def create_app(config_class=Config, instance_path=None):
+    """Build the app from config.Config; used by wsgi.py, `flask` and `python app.py`.
+
+    instance_path (default $INSTANCE_PATH, else ./instance) holds the
+    runtime files: carts.db, catalog.stamp and relative sqlite databases.
+    """
+    app = Flask(__name__, instance_path=instance_path or os.environ.get('INSTANCE_PATH') or None)
+    app.config.from_object(config_class)
+
+    # DB
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    if uri.startswith('sqlite:///') and ':memory:' not in uri:
+        app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {
+            'pool_size': app.config['DB_POOL_SIZE'],
+            'max_overflow': app.config['DB_POOL_OVERFLOW'],
+            'connect_args': {'timeout': app.config['SQLITE_BUSY_TIMEOUT_MS'] / 1000},
+        })
+
+    # Upload folders; the QR folder is created on the first QR code
+    for folder in ('UPLOAD_FOLDER', 'BILLS_FOLDER'):
+        os.makedirs(app.config[folder], exist_ok=True)
+    os.makedirs(app.instance_path, exist_ok=True)
+
+    db.init_app(app)
+    login_manager.init_app(app)
+    socketio.init_app(app, cors_allowed_origins="*", **socketio_queue_options(app))
+    app.extensions['carts'] = cart_store.create_cart_store(
+        app.config['CART_STORE'], app.config['CART_TTL'],
+        app.config['CART_DB_PATH'] or os.path.join(app.instance_path, 'carts.db'))
+    catalog_cache.init_app(app)
+    app.extensions['login_limiter'] = TokenBucket(app.config['LOGIN_RATE_BURST'],
+                                                  app.config['LOGIN_RATE_PER_MINUTE'] / 60)
+    app.register_blueprint(bp)
+    return app
+
+def socketio_queue_options(app):
+    # Emits go through the queue so clients connected to other workers get them too
+    url = app.config['SOCKETIO_MESSAGE_QUEUE']
+    if not url:
+        return {}
+    if url.startswith('sqlite:'):
+        return {'client_manager': socketio_queue.SQLiteManager(url)}
+    return {'message_queue': url}
+
+@event.listens_for(Engine, 'connect')
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets the order routes, SocketIO handler and bill jobs read while one
+    # of them writes; NORMAL sync is durable enough with WAL and much cheaper.
+    # The busy timeout is the driver's `timeout` connect arg, set in create_app().
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.close()
+
+@bp.app_context_processor
+def inject_socket_options():
+    return {'socket_transports': current_app.config['SOCKETIO_TRANSPORTS']}
+
+# -------------------- Metrics --------------------
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+SQL_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+metrics_registry = metrics.Registry()
+request_seconds = metrics_registry.histogram(
+    'http_request_duration_seconds', 'Request latency by endpoint.', ['endpoint', 'method'])
+requests_total = metrics_registry.counter(
+    'http_requests_total', 'Requests by endpoint and status code.', ['endpoint', 'method', 'status'])
+request_queries = metrics_registry.histogram(
+    'http_request_sql_queries', 'SQL statements per request.', ['endpoint'], QUERY_COUNT_BUCKETS)
+request_sql_seconds = metrics_registry.histogram(
+    'http_request_sql_seconds', 'Time spent in SQL per request.', ['endpoint'], SQL_BUCKETS)
+sql_seconds = metrics_registry.histogram(
+    'sql_query_duration_seconds', 'Duration of single SQL statements.', [], SQL_BUCKETS)
+socketio_handler_seconds = metrics_registry.histogram(
+    'socketio_handler_duration_seconds', 'SocketIO event handler latency.', ['event'])
+socketio_emits = metrics_registry.counter(
+    'socketio_emits_total', 'Server-side emit calls by event.', ['event'])
+bill_render_seconds = metrics_registry.histogram(
+    'bill_render_duration_seconds', 'Bill rendering time by renderer.', ['renderer'])
+
+@metrics_registry.collector
+def catalog_cache_metrics():
+    stats = dict(catalog_cache.stats)
+    return [('catalog_cache_hits_total', 'counter', 'Catalog snapshot reads served from memory.', stats['hits']),
+            ('catalog_cache_misses_total', 'counter', 'Catalog reads that took the rebuild lock.', stats['misses']),
+            ('catalog_cache_rebuilds_total', 'counter', 'Catalog snapshots loaded from the DB.', stats['rebuilds']),
+            ('catalog_cache_version', 'gauge', 'Local catalog version.', catalog_cache.version)]
+
+@bp.before_app_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    g.sql_count = 0
+    g.sql_seconds = 0.0
+    # Statements are only kept when the slow-request log is on
+    g.sql_log = [] if current_app.config['SLOW_REQUEST_MS'] else None
+
+@bp.after_app_request
+def record_request_metrics(response):
+    started = g.get('request_started')
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    endpoint = request.endpoint or 'unmatched'  # one series for all 404s, not one per URL
+    request_seconds.observe(elapsed, endpoint, request.method)
+    requests_total.inc(endpoint, request.method, str(response.status_code))
+    request_queries.observe(g.sql_count, endpoint)
+    request_sql_seconds.observe(g.sql_seconds, endpoint)
+
+    slow_ms = current_app.config['SLOW_REQUEST_MS']
+    if slow_ms and elapsed * 1000 >= slow_ms:
+        current_app.logger.warning(
+            "Slow request %s %s: %.1f ms, %d queries, %.1f ms in SQL%s",
+            request.method, request.full_path.rstrip('?'), elapsed * 1000, g.sql_count, g.sql_seconds * 1000,
+            ''.join(f"\n  {ms:8.2f} ms  {' '.join(statement.split())}" for statement, ms in g.sql_log))
+    return response
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._query_started = time.perf_counter()
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def record_query_metrics(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_query_started', None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    sql_seconds.observe(elapsed)
+    # SocketIO handlers run in a request context too, without the before hook
+    if has_request_context():
+        g.sql_count = g.get('sql_count', 0) + 1
+        g.sql_seconds = g.get('sql_seconds', 0.0) + elapsed
+        if g.get('sql_log') is not None:
+            g.sql_log.append((statement, elapsed * 1000))
+
+def timed_socket_handler(event_name):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                socketio_handler_seconds.observe(time.perf_counter() - started, event_name)
+        return wrapper
+    return decorator
+
+@bp.route('/admin/metrics')
+def metrics_endpoint():
+    # Staff session, or "Authorization: Bearer <METRICS_TOKEN>" for a scraper
+    token = current_app.config['METRICS_TOKEN']
+    if not current_user.is_authenticated and not (
+            token and request.headers.get('Authorization') == f"Bearer {token}"):
+        return login_manager.unauthorized()
+    response = make_response(metrics_registry.render())
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
 
 # -------------------- PDFKIT CONFIG --------------------
-WKHTMLTOPDF_PATH = r"C:\Program Files\wkhtmltopdf\bin\wkhtmltopdf.exe"
-config = pdfkit.configuration(wkhtmltopdf=WKHTMLTOPDF_PATH)
+# WKHTMLTOPDF_PATH env wins; otherwise the default Windows install or PATH
+WKHTMLTOPDF_PATH = os.environ.get('WKHTMLTOPDF_PATH') or (
+    r"C:\Program Files\wkhtmltopdf\bin\wkhtmltopdf.exe" if os.name == 'nt'
+    else shutil.which('wkhtmltopdf') or 'wkhtmltopdf')
+_pdfkit_config = None
+
+def get_pdfkit_config():
+    # Created on first use so the app still starts where wkhtmltopdf is not
+    # installed and bills go through the native receipt renderer instead.
+    global _pdfkit_config
+    if _pdfkit_config is None:
+        _pdfkit_config = pdfkit.configuration(wkhtmltopdf=WKHTMLTOPDF_PATH)
+    return _pdfkit_config
 
 # -------------------- Models --------------------
+# Werkzeug hashes look like "pbkdf2:sha256:600000$salt$hash"
+PASSWORD_HASH_PREFIXES = ('pbkdf2:', 'scrypt:')
+
+def password_hash_method():
+    return f"pbkdf2:sha256:{current_app.config['PASSWORD_HASH_ITERATIONS']}"
+
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True)
-    password = db.Column(db.String(80))
+    password = db.Column(db.String(255))  # salted hash; plaintext in rows from before hashing
+
+    def set_password(self, password):
+        self.password = generate_password_hash(password, method=password_hash_method())
+
+    def check_password(self, password):
+        if not self.password:
+            return False
+        if not self.password.startswith(PASSWORD_HASH_PREFIXES):
+            return hmac.compare_digest(self.password.encode('utf-8'), password.encode('utf-8'))
+        return check_password_hash(self.password, password)
+
+    def password_needs_rehash(self):
+        # Still plaintext, or hashed with a different work factor
+        return not (self.password or '').startswith(password_hash_method() + '$')
 
 class Category(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -55,8 +266,9 @@ class Product(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100))
     price = db.Column(db.Float)
-    category_id = db.Column(db.Integer, db.ForeignKey('category.id'))
+    category_id = db.Column(db.Integer, db.ForeignKey('category.id'), index=True)
     image = db.Column(db.String(100))
+    image_key = db.Column(db.String(16))  # product_images variants; None until built
     category = db.relationship('Category')
 
 class Table(db.Model):
@@ -64,6 +276,11 @@ class Table(db.Model):
     name = db.Column(db.String(50))
 
 class Order(db.Model):
+    __table_args__ = (
+        db.Index('ix_order_table_status', 'table_id', 'status'),
+        db.Index('ix_order_status_created', 'status', 'created_at'),
+        db.Index('ix_order_created_id', 'created_at', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     table_id = db.Column(db.Integer, db.ForeignKey('table.id'))
     status = db.Column(db.String(20), default='pending')
@@ -75,6 +292,10 @@ class Order(db.Model):
     )
 
 class OrderItem(db.Model):
+    __table_args__ = (
+        # One line per product per order; also serves order_id lookups
+        db.Index('uq_order_item_order_product', 'order_id', 'product_id', unique=True),
+    )
     id = db.Column(db.Integer, primary_key=True)
     order_id = db.Column(db.Integer, db.ForeignKey('order.id'))
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'))
@@ -82,111 +303,571 @@ class OrderItem(db.Model):
     price = db.Column(db.Float)
     product = db.relationship('Product')
 
+class SalesRollup(db.Model):
+    """Sales of completed orders pre-aggregated per hour or day.
+
+    dimension is one of ROLLUP_DIMENSIONS and dim_key the product, category
+    or table id (0 for 'total'). Orders are bucketed by their created_at.
+    """
+    __table_args__ = (
+        db.Index('uq_sales_rollup', 'period', 'dimension', 'bucket', 'dim_key', unique=True),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    period = db.Column(db.String(4), nullable=False)
+    bucket = db.Column(db.DateTime, nullable=False)
+    dimension = db.Column(db.String(10), nullable=False)
+    dim_key = db.Column(db.Integer, nullable=False)
+    revenue = db.Column(db.Float, default=0)
+    quantity = db.Column(db.Integer, default=0)
+    orders = db.Column(db.Integer, default=0)
+    turnaround_seconds = db.Column(db.Float, default=0)
+    turnaround_orders = db.Column(db.Integer, default=0)
+
+class RolledUpOrder(db.Model):
+    # Orders already counted in SalesRollup, so a completion is only added once
+    order_id = db.Column(db.Integer, primary_key=True)
+
+class KdsEvent(db.Model):
+    # Kitchen display change log; AUTOINCREMENT keeps seq increasing after pruning
+    __table_args__ = {'sqlite_autoincrement': True}
+    seq = db.Column(db.Integer, primary_key=True)
+    payload = db.Column(db.Text, nullable=False)
+
+class ArchivedOrder(db.Model):
+    """Completed order moved out of `order` by archive_orders(); keeps its id."""
+    __table_args__ = (
+        db.Index('ix_archived_order_created_id', 'created_at', 'id'),
+    )
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    table_id = db.Column(db.Integer, db.ForeignKey('table.id'))
+    status = db.Column(db.String(20))
+    created_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime)
+    table = db.relationship('Table')
+    order_items = db.relationship('ArchivedOrderItem', backref='order', cascade="all, delete-orphan")
+
+class ArchivedOrderItem(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, db.ForeignKey('archived_order.id'), index=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'))
+    qty = db.Column(db.Integer)
+    price = db.Column(db.Float)
+    product = db.relationship('Product')
+
+def order_total_column(model=Order, item_model=OrderItem):
+    """Correlated SUM(order_item.price) for the Order (or ArchivedOrder) row being selected."""
+    return (db.select(db.func.coalesce(db.func.sum(item_model.price), 0))
+            .where(item_model.order_id == model.id)
+            .correlate(model)
+            .scalar_subquery()
+            .label('total'))
+
+# -------------------- Catalog Cache --------------------
+# Plain records instead of ORM instances so the snapshot can outlive the
+# session that loaded it and be shared across requests.
+CatalogCategory = namedtuple('CatalogCategory', 'id name')
+CatalogProduct = namedtuple('CatalogProduct', 'id name price category_id image image_key')
+
+class CatalogSnapshot:
+    def __init__(self, version, categories, products):
+        self.version = version
+        self.categories = categories
+        self.products = products
+        self.products_by_id = {p.id: p for p in products}
+        self.products_by_category = {c.id: [] for c in categories}
+        for p in products:
+            self.products_by_category.setdefault(p.category_id, []).append(p)
+        # Content hash, so ETags stay valid across restarts and workers
+        self.etag = hashlib.sha1(repr((categories, products)).encode('utf-8')).hexdigest()[:20]
+        self.menu_json = None  # encoded /api/menu body, filled on first request
+        # Products shown on the menu (those in a category), in menu order
+        self.menu_products = [p for c in categories for p in self.products_by_category[c.id]]
+        self._search_index = None
+        self._admin_search_index = None
+        self.fragments = {}  # rendered menu category blocks, see menu_category_block()
+
+    @property
+    def search_index(self):
+        # Built on first search; CRUD replaces the snapshot and with it the index
+        if self._search_index is None:
+            self._search_index = product_search.SearchIndex(self.menu_products)
+        return self._search_index
+
+    @property
+    def admin_search_index(self):
+        # Every product, so admins also find the ones without a category
+        if self._admin_search_index is None:
+            self._admin_search_index = product_search.SearchIndex(self.products)
+        return self._admin_search_index
+
+class ChangeStamp:
+    """Token file in the instance folder, replaced whenever shared data changes.
+
+    Workers compare it with the token they built their in-process copy from,
+    so a change made in one worker is picked up by the others.
+    """
+    def __init__(self, path=None):
+        self.path = path
+
+    def read(self):
+        if self.path is None:
+            return None
+        try:
+            with open(self.path) as f:
+                return f.read()
+        except FileNotFoundError:
+            return ''
+
+    def bump(self):
+        if self.path is None:
+            return
+        token = uuid.uuid4().hex
+        tmp_path = f"{self.path}.{token}"
+        with open(tmp_path, 'w') as f:
+            f.write(token)
+        os.replace(tmp_path, self.path)
+
+class CatalogCache:
+    """Versioned in-process snapshot of the menu catalog.
+
+    Readers get the current snapshot without touching the DB; admin CRUD
+    calls invalidate() after committing and the next reader rebuilds it.
+    Other workers notice the change through the shared ChangeStamp.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._token = None
+        self.stamp = ChangeStamp()
+        self.version = 0
+        self.stats = {'hits': 0, 'misses': 0, 'rebuilds': 0}
+
+    def init_app(self, app):
+        self.stamp = ChangeStamp(os.path.join(app.instance_path, 'catalog.stamp'))
+        self._snapshot = None
+
+    def get(self):
+        snapshot = self._snapshot
+        token = self.stamp.read()
+        if snapshot is not None and token == self._token:
+            self.stats['hits'] += 1
+            return snapshot
+        with self._lock:
+            self.stats['misses'] += 1
+            if self._snapshot is None or token != self._token:
+                # Token first: a change committed while building makes it stale again
+                self._snapshot = self._build()
+                self._token = token
+            return self._snapshot
+
+    def _build(self):
+        categories = [CatalogCategory(c.id, c.name) for c in Category.query.order_by(Category.id).all()]
+        products = [CatalogProduct(p.id, p.name, p.price, p.category_id, p.image, p.image_key)
+                    for p in Product.query.order_by(Product.id).all()]
+        self.stats['rebuilds'] += 1
+        return CatalogSnapshot(self.version, categories, products)
+
+    def invalidate(self):
+        # Taking the lock means an in-flight rebuild finishes first and is
+        # then discarded, so readers never keep a pre-commit snapshot.
+        with self._lock:
+            self.version += 1
+            self._snapshot = None
+            self.stamp.bump()
+
+catalog_cache = CatalogCache()
+
 # -------------------- Load User --------------------
+class SessionUser(UserMixin):
+    """The logged-in user as kept by UserCache; only what requests need."""
+    def __init__(self, id, username):
+        self.id = id
+        self.username = username
+
+class UserCache:
+    """load_user() results kept for USER_CACHE_TTL seconds.
+
+    Every admin page and SocketIO event loads the user, so this keeps those
+    off the DB. Per process: a user removed in one worker stays logged in
+    on the others for up to the TTL.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._users = {}  # id -> (expires_at, SessionUser)
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def get(self, user_id, ttl):
+        now = time.monotonic()
+        entry = self._users.get(user_id)
+        if entry is not None and entry[0] > now:
+            self.stats['hits'] += 1
+            return entry[1]
+        self.stats['misses'] += 1
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        session_user = SessionUser(user.id, user.username)
+        if ttl > 0:
+            with self._lock:
+                self._users[user_id] = (now + ttl, session_user)
+        return session_user
+
+    def invalidate(self, user_id=None):
+        with self._lock:
+            if user_id is None:
+                self._users.clear()
+            else:
+                self._users.pop(user_id, None)
+
+user_cache = UserCache()
+
+@metrics_registry.collector
+def user_cache_metrics():
+    stats = dict(user_cache.stats)
+    return [('user_cache_hits_total', 'counter', 'load_user calls served from memory.', stats['hits']),
+            ('user_cache_misses_total', 'counter', 'load_user calls that queried the DB.', stats['misses'])]
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+    return user_cache.get(user_id, current_app.config['USER_CACHE_TTL'])
+
+# -------------------- SocketIO Rooms --------------------
+# Order events go only to staff screens and the devices at the order's table
+# instead of every connected phone.
+KITCHEN_ROOM = 'kitchen'
+ADMIN_ROOM = 'admin'
+STATUS_BATCH_WINDOW = 0.25  # seconds of status changes coalesced into one event
+
+def table_room(table_id):
+    return f"table:{table_id}"
+
+def emit_order_event(event, payload, table_id):
+    try:
+        socketio.emit(event, payload, to=[KITCHEN_ROOM, ADMIN_ROOM, table_room(table_id)])
+    except Exception:
+        pass
+
+@socketio.on('connect')
+@timed_socket_handler('connect')
+def handle_connect(auth=None):
+    """Customer pages pass {table_id}; staff screens are recognised by login
+    and the kitchen display also passes {kitchen: true}."""
+    auth = auth if isinstance(auth, dict) else {}
+    try:
+        table_id = int(auth.get('table_id') or 0)
+    except (TypeError, ValueError):
+        table_id = 0
+    if table_id:
+        join_room(table_room(table_id))
+    if current_user.is_authenticated:
+        join_room(ADMIN_ROOM)
+        if auth.get('kitchen'):
+            join_room(KITCHEN_ROOM)
+
+class StatusBatcher:
+    """Coalesces status changes made within `window` seconds into one
+    order_status_batch event per room, keeping only each order's latest status."""
+
+    def __init__(self, window):
+        self.window = window
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._scheduled = False
+
+    def add(self, order_id, table_id, status):
+        with self._lock:
+            self._pending[order_id] = {'order_id': order_id, 'table_id': table_id, 'status': status}
+            if self._scheduled:
+                return
+            self._scheduled = True
+        socketio.start_background_task(self._flush_later)
+
+    def _flush_later(self):
+        socketio.sleep(self.window)
+        self.flush()
+
+    def flush(self):
+        with self._lock:
+            changes = list(self._pending.values())
+            self._pending.clear()
+            self._scheduled = False
+        if not changes:
+            return
+        try:
+            socketio.emit('order_status_batch', {'changes': changes}, to=[KITCHEN_ROOM, ADMIN_ROOM])
+            by_table = {}
+            for change in changes:
+                by_table.setdefault(change['table_id'], []).append(change)
+            for table_id, table_changes in by_table.items():
+                socketio.emit('order_status_batch', {'changes': table_changes}, to=table_room(table_id))
+        except Exception:
+            pass
+
+status_batcher = StatusBatcher(STATUS_BATCH_WINDOW)
 
 # -------------------- Helper: QR generation --------------------
-def generate_table_qr(table_id):
-    host = BASE_HOST_FOR_QR
-    qr_url = f"{host}/menu/{table_id}"
-    qr_folder = app.config['QRCODE_FOLDER']
-    os.makedirs(qr_folder, exist_ok=True)
-    qr_path = os.path.join(qr_folder, f"table_{table_id}.png")
-
-    qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_H, box_size=6, border=4)
-    qr.add_data(qr_url)
-    qr.make(fit=True)
-    img = qr.make_image(fill_color="black", back_color="white")
-    img.save(qr_path)
-    return f"qrcodes/table_{table_id}.png"
+# QR files are generated on first request and named by a hash of the URL
+# they encode, so renaming a table never regenerates its code.
+QR_MAX_AGE = 24 * 3600
+
+def table_qr_url(table_id):
+    return f"{current_app.config['BASE_HOST_FOR_QR']}/menu/{table_id}"
+
+def table_qr_path(table_id, fmt='png'):
+    """Path of the cached QR image for a table, generating it if missing."""
+    digest = table_qr.url_digest(table_qr_url(table_id))
+    path = os.path.join(current_app.config['QRCODE_FOLDER'], f"qr_{digest}.{fmt}")
+    if not os.path.exists(path):
+        os.makedirs(current_app.config['QRCODE_FOLDER'], exist_ok=True)
+        tmp_path = os.path.join(current_app.config['QRCODE_FOLDER'], f".qr_{digest}.{fmt}")
+        with open(tmp_path, 'wb') as f:
+            f.write(table_qr.make_qr(table_qr_url(table_id), fmt))
+        os.replace(tmp_path, path)
+    return path
 
 def remove_table_qr(table_id):
-    qr_path = os.path.join(app.config['QRCODE_FOLDER'], f"table_{table_id}.png")
-    if os.path.exists(qr_path):
-        try:
-            os.remove(qr_path)
-        except OSError:
-            pass
+    digest = table_qr.url_digest(table_qr_url(table_id))
+    names = [f"qr_{digest}.{fmt}" for fmt in table_qr.QR_FORMATS] + [f"table_{table_id}.png"]
+    for name in names:
+        qr_path = os.path.join(current_app.config['QRCODE_FOLDER'], name)
+        if os.path.exists(qr_path):
+            try:
+                os.remove(qr_path)
+            except OSError:
+                pass
+
+# QR sheet jobs: the sheet file name is a hash of its contents, so a job is
+# done exactly when that file exists.
+qr_sheet_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='qr-sheet')
+qr_sheet_jobs = {}
+qr_sheet_lock = threading.Lock()
+
+def build_qr_sheet_job(folder, job_id, entries):
+    path = os.path.join(folder, job_id)
+    tmp_path = os.path.join(folder, '.' + job_id)
+    try:
+        with ProcessPoolExecutor() as pool:
+            pdf = table_qr.build_qr_sheet(entries, executor=pool)
+        os.makedirs(folder, exist_ok=True)
+        with open(tmp_path, 'wb') as f:
+            f.write(pdf)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        with qr_sheet_lock:
+            qr_sheet_jobs[job_id] = {'status': 'failed', 'error': str(e)}
+        return
+    with qr_sheet_lock:
+        qr_sheet_jobs.pop(job_id, None)
+
+# -------------------- Product Images --------------------
+# Uploads are saved as-is and resized in the background. Until the variants
+# exist (image_key is None) pages fall back to the uploaded file.
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+image_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='product-image')
+
+def image_variants_folder(config):
+    return os.path.join(config['UPLOAD_FOLDER'], 'variants')
+
+def image_source_folders(config):
+    return [config['UPLOAD_FOLDER'], config['LEGACY_UPLOAD_FOLDER']]
+
+def image_source_path(config, filename):
+    for folder in image_source_folders(config):
+        path = os.path.join(folder, filename)
+        if os.path.isfile(path):
+            return path
+    return None
+
+def process_product_image(app, product_id, filename):
+    with app.app_context():
+        path = image_source_path(app.config, filename)
+        if path is None:
+            return
+        _, key, error = product_images.build_file_variants(path, image_variants_folder(app.config))
+        if error:
+            app.logger.warning("Could not build image variants for %s: %s", filename, error)
+            return
+        # Only if the product still has this image; it may have been replaced meanwhile
+        updated = Product.query.filter_by(id=product_id, image=filename).update({'image_key': key})
+        db.session.commit()
+        if updated:
+            catalog_cache.invalidate()
+
+def submit_product_image(product):
+    if product.image:
+        image_executor.submit(process_product_image, current_app._get_current_object(),
+                              product.id, product.image)
+
+def variant_url(filename):
+    return url_for('static', filename='images/variants/' + filename)
+
+@bp.app_template_global()
+def product_image_variant(product, variant='thumb', fmt='jpeg'):
+    if product.image_key:
+        return variant_url(product_images.variant_filename(product.image_key, variant, fmt))
+    return url_for('static', filename='images/' + (product.image or 'no-image.png'))
+
+@bp.app_template_global()
+def product_image_srcset(product, fmt='jpeg'):
+    if not product.image_key:
+        return ''
+    return product_images.srcset(product.image_key, fmt, variant_url)
+
+@bp.after_app_request
+def cache_image_variants(response):
+    # Variant names are content hashes, so browsers never need to revalidate
+    if (request.endpoint == 'static' and response.status_code in (200, 304)
+            and (request.view_args or {}).get('filename', '').startswith('images/variants/')):
+        response.cache_control.public = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+        response.cache_control.no_cache = None
+    return response
 
 # -------------------- Admin Login/Logout --------------------
-@app.route('/admin/login', methods=['GET','POST'])
+class TokenBucket:
+    """In-memory token bucket per key: `capacity` attempts in a burst, then
+    `rate` more per second. Per process, like the other in-memory state."""
+    MAX_KEYS = 10000
+
+    def __init__(self, capacity, rate):
+        self.capacity = capacity
+        self.rate = rate
+        self._lock = threading.Lock()
+        self._buckets = {}  # key -> (tokens, updated_at)
+
+    def take(self, key):
+        """Spend one token; returns 0 if allowed, else seconds until one is available."""
+        now = time.monotonic()
+        with self._lock:
+            if len(self._buckets) >= self.MAX_KEYS:
+                self._prune(now)
+            tokens, updated_at = self._buckets.get(key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - updated_at) * self.rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                return 0
+            self._buckets[key] = (tokens, now)
+            return (1 - tokens) / self.rate
+
+    def _prune(self, now):
+        # Buckets that have refilled completely behave like missing ones
+        for key in [k for k, (tokens, updated_at) in self._buckets.items()
+                    if tokens + (now - updated_at) * self.rate >= self.capacity]:
+            del self._buckets[key]
+
+_dummy_password_hash = None
+
+def check_unknown_user_password(password):
+    # Hash anyway for unknown usernames, so response time does not reveal which exist
+    global _dummy_password_hash
+    if _dummy_password_hash is None:
+        _dummy_password_hash = generate_password_hash(uuid.uuid4().hex, method=password_hash_method())
+    check_password_hash(_dummy_password_hash, password)
+
+@bp.route('/admin/login', methods=['GET','POST'])
 def admin_login():
     if request.method == 'POST':
+        # 🔹 Har IP ke liye limited attempts, taaki password guess na kiya ja sake
+        retry_after = current_app.extensions['login_limiter'].take(request.remote_addr or '')
+        if retry_after:
+            retry_after = math.ceil(retry_after)
+            flash(f"Too many login attempts. Try again in {retry_after} seconds.", "danger")
+            response = make_response(render_template('admin_login.html'), 429)
+            response.headers['Retry-After'] = str(retry_after)
+            return response
+
         username = request.form['username']
         password = request.form['password']
-        user = User.query.filter_by(username=username, password=password).first()
-        if user:
+        user = User.query.filter_by(username=username).first()
+        if user is None:
+            check_unknown_user_password(password)
+        if user and user.check_password(password):
+            if user.password_needs_rehash():
+                # Plaintext from before hashing (the seeded owner) or an old work factor
+                user.set_password(password)
+                db.session.commit()
+            user_cache.invalidate(user.id)
             login_user(user)
-            return redirect(url_for('admin_index'))
+            return redirect(url_for('main.admin_index'))
         else:
             flash("Invalid credentials", "danger")
     return render_template('admin_login.html')
 
-@app.route('/admin/logout')
+@bp.route('/admin/logout')
 @login_required
 def admin_logout():
     logout_user()
-    return redirect(url_for('admin_login'))
+    return redirect(url_for('main.admin_login'))
 
-@app.route('/logout')
+@bp.route('/logout')
 @login_required
 def logout():
     logout_user()
-    return redirect(url_for('admin_login'))
+    return redirect(url_for('main.admin_login'))
 
 # -------------------- Admin Dashboard --------------------
-@app.route('/admin/')
+@bp.route('/admin/')
 @login_required
 def admin_index():
     return render_template('admin_index.html')
 
 # -------------------- CRUD: Categories --------------------
-@app.route('/admin/categories')
+@bp.route('/admin/categories')
 @login_required
 def admin_categories():
     categories = Category.query.all()
     return render_template('admin_categories.html', categories=categories)
 
-@app.route('/admin/categories/add', methods=['GET','POST'])
+@bp.route('/admin/categories/add', methods=['GET','POST'])
 @login_required
 def add_category():
     if request.method == 'POST':
         db.session.add(Category(name=request.form['name']))
         db.session.commit()
-        return redirect(url_for('admin_categories'))
+        catalog_cache.invalidate()
+        return redirect(url_for('main.admin_categories'))
     return render_template('admin_add_category.html')
 
-@app.route('/admin/categories/edit/<int:id>', methods=['GET','POST'])
+@bp.route('/admin/categories/edit/<int:id>', methods=['GET','POST'])
 @login_required
 def edit_category(id):
     category = Category.query.get_or_404(id)
     if request.method == 'POST':
         category.name = request.form['name']
         db.session.commit()
-        return redirect(url_for('admin_categories'))
+        catalog_cache.invalidate()
+        return redirect(url_for('main.admin_categories'))
     return render_template('admin_edit_category.html', category=category)
 
-@app.route('/admin/categories/delete/<int:id>')
+@bp.route('/admin/categories/delete/<int:id>')
 @login_required
 def delete_category(id):
     category = Category.query.get_or_404(id)
     db.session.delete(category)
     db.session.commit()
-    return redirect(url_for('admin_categories'))
+    catalog_cache.invalidate()
+    return redirect(url_for('main.admin_categories'))
 
 # -------------------- CRUD: Products --------------------
-@app.route('/admin/products')
+@bp.route('/admin/products')
 @login_required
 def admin_products():
     page = request.args.get('page', 1, type=int)
     category_id = request.args.get('category_id', type=int)
     sort_by = request.args.get('sort_by', 'newest')
+    q = request.args.get('q', '').strip() or None
 
     query = Product.query
     if category_id:
         query = query.filter_by(category_id=category_id)
+    if q:
+        index = catalog_cache.get().admin_search_index
+        query = query.filter(Product.id.in_([index.products[p].id for p in index.match(q)]))
 
     if sort_by == 'name_asc':
         query = query.order_by(Product.name.asc())
@@ -204,9 +885,9 @@ def admin_products():
     products = query.paginate(page=page, per_page=10)
     categories = Category.query.all()
     return render_template('admin_products.html', products=products, categories=categories,
-                           category_id=category_id, sort_by=sort_by)
+                           category_id=category_id, sort_by=sort_by, q=q)
 
-@app.route('/admin/products/add', methods=['GET','POST'])
+@bp.route('/admin/products/add', methods=['GET','POST'])
 @login_required
 def add_product():
     categories = Category.query.all()
@@ -219,16 +900,18 @@ def add_product():
         filename = None
         if image_file and image_file.filename:
             filename = secure_filename(image_file.filename)
-            image_file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+            image_file.save(os.path.join(current_app.config['UPLOAD_FOLDER'], filename))
 
         product = Product(name=name, price=price, category_id=category_id, image=filename)
         db.session.add(product)
         db.session.commit()
-        return redirect(url_for('admin_products'))
+        catalog_cache.invalidate()
+        submit_product_image(product)
+        return redirect(url_for('main.admin_products'))
 
     return render_template('admin_add_product.html', categories=categories)
 
-@app.route('/admin/products/edit/<int:id>', methods=['GET','POST'])
+@bp.route('/admin/products/edit/<int:id>', methods=['GET','POST'])
 @login_required
 def edit_product(id):
     product = Product.query.get_or_404(id)
@@ -241,293 +924,1458 @@ def edit_product(id):
         image_file = request.files.get('image')
         if image_file and image_file.filename:
             filename = secure_filename(image_file.filename)
-            image_file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+            image_file.save(os.path.join(current_app.config['UPLOAD_FOLDER'], filename))
             product.image = filename
+            product.image_key = None
 
         db.session.commit()
-        return redirect(url_for('admin_products'))
+        catalog_cache.invalidate()
+        if product.image_key is None:
+            submit_product_image(product)
+        return redirect(url_for('main.admin_products'))
 
     return render_template('admin_edit_product.html', product=product, categories=categories)
 
-@app.route('/admin/products/delete/<int:id>')
+@bp.route('/admin/products/delete/<int:id>')
 @login_required
 def delete_product(id):
     product = Product.query.get_or_404(id)
     db.session.delete(product)
     db.session.commit()
-    return redirect(url_for('admin_products'))
+    catalog_cache.invalidate()
+    return redirect(url_for('main.admin_products'))
+
+# -------------------- Catalog Import/Export --------------------
+# Whole menus as CSV/JSON (see catalog_io.py) plus a zip of images, for
+# loading a new menu or copying one to another branch.
+IMPORT_ERROR_LIMIT = 500  # row errors kept for the report; error_count covers all
+
+class ImportReport:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.images = 0
+        self.error_count = 0
+        self.errors = []  # (line, message)
+
+    def error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < IMPORT_ERROR_LIMIT:
+            self.errors.append((line, message))
+
+def import_image(name, images, zipped, extracted, config):
+    """File name to store for an image column value, extracting it from the zip if it is there."""
+    filename = secure_filename(os.path.basename(name))
+    info = zipped.get(os.path.basename(name))
+    if info is not None and filename and filename not in extracted:
+        folder = config['UPLOAD_FOLDER']
+        fd, tmp_path = tempfile.mkstemp(dir=folder, prefix='.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as out, images.open(info) as source:
+                shutil.copyfileobj(source, out)
+            os.replace(tmp_path, os.path.join(folder, filename))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        extracted.add(filename)
+    elif info is None and (not filename or image_source_path(config, filename) is None):
+        raise catalog_io.RowError(f"image {name!r} is neither in the zip nor in static/images")
+    return filename
+
+def import_chunk(chunk, categories, extracted, report):
+    """Upsert one chunk of clean rows in a single transaction."""
+    by_key = {(values['category'], values['name']): values for values in chunk}  # last row wins
+    begin_write_transaction()
+    try:
+        new_categories = sorted({category for category, _ in by_key} - categories.keys())
+        if new_categories:
+            db.session.execute(db.insert(Category), [{'name': name} for name in new_categories])
+            categories.update(db.session.query(Category.name, Category.id)
+                              .filter(Category.name.in_(new_categories)))
+        existing = {}
+        for product_id, category_id, name, image in (
+                db.session.query(Product.id, Product.category_id, Product.name, Product.image)
+                .filter(Product.name.in_({name for _, name in by_key})).order_by(Product.id)):
+            existing.setdefault((category_id, name), (product_id, image))
+
+        inserts, updates = [], []
+        for (category, name), values in by_key.items():
+            row = {'name': name, 'price': values['price'], 'category_id': categories[category]}
+            match = existing.get((row['category_id'], name))
+            if values['image'] and (match is None or match[1] != values['image'] or values['image'] in extracted):
+                # New or replaced image file: variants are rebuilt below
+                row.update(image=values['image'], image_key=None)
+            if match is None:
+                inserts.append(dict({'image': None, 'image_key': None}, **row))
+            else:
+                updates.append(dict(row, id=match[0]))
+        if inserts:
+            db.session.execute(db.insert(Product), inserts)
+        if updates:
+            db.session.execute(db.update(Product), updates)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    report.created += len(inserts)
+    report.updated += len(updates)
+
+    for product in (Product.query.filter(Product.name.in_({name for _, name in by_key}),
+                                         Product.image.isnot(None), Product.image_key.is_(None))):
+        submit_product_image(product)
+
+def import_catalog(rows, images=None, chunk_size=None):
+    """Create or update categories and products from (line, row) pairs.
+
+    Rows are validated one by one and written CATALOG_IMPORT_CHUNK at a
+    time, each chunk in its own transaction, so memory stays flat however
+    long the file is. images is an open ZipFile whose files are matched to
+    the image column by base name. Invalid rows are skipped and reported.
+    """
+    config = current_app.config
+    chunk_size = chunk_size or config['CATALOG_IMPORT_CHUNK']
+    report = ImportReport()
+    zipped = {}
+    if images is not None:
+        zipped = {os.path.basename(info.filename): info for info in images.infolist() if not info.is_dir()}
+    categories = dict(db.session.query(Category.name, Category.id))
+    extracted, chunk, line = set(), [], 0
+    try:
+        try:
+            for line, row in rows:
+                try:
+                    values = catalog_io.clean_row(row, product_images.IMAGE_EXTENSIONS)
+                    if values['image']:
+                        values['image'] = import_image(values['image'], images, zipped, extracted, config)
+                except catalog_io.RowError as e:
+                    report.error(line, str(e))
+                    continue
+                chunk.append(values)
+                if len(chunk) >= chunk_size:
+                    import_chunk(chunk, categories, extracted, report)
+                    chunk = []
+                    extracted.clear()
+        except (catalog_io.RowError, csv.Error, ValueError) as e:
+            # Unreadable from here on (bad header, encoding, JSON); the rows before it are still imported
+            report.error(line, f"Stopped reading the file: {e}")
+        if chunk:
+            import_chunk(chunk, categories, extracted, report)
+    finally:
+        if report.created or report.updated:
+            catalog_cache.invalidate()
+    return report
+
+def catalog_export_rows():
+    query = (db.session.query(Category.name, Product.name, Product.price, Product.image)
+             .join(Category, Category.id == Product.category_id)
+             .order_by(Category.id, Product.id)
+             .execution_options(yield_per=500))
+    for category, name, price, image in query:
+        yield {'category': category, 'name': name, 'price': price, 'image': image}
+
+@bp.route('/admin/products/import', methods=['GET', 'POST'])
+@login_required
+def import_products():
+    report = None
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash("Choose a CSV or JSON file to import.", "warning")
+            return redirect(url_for('main.import_products'))
+        image_zip = request.files.get('images')
+        with contextlib.ExitStack() as stack:
+            images = None
+            if image_zip and image_zip.filename:
+                try:
+                    images = stack.enter_context(zipfile.ZipFile(image_zip.stream))
+                except zipfile.BadZipFile:
+                    flash("The images file is not a zip archive.", "danger")
+                    return redirect(url_for('main.import_products'))
+            # 🔹 File ko row by row padho, poora memory mein load nahi hota
+            stream = codecs.getreader('utf-8-sig')(upload.stream)
+            report = import_catalog(catalog_io.read_rows(stream, catalog_io.detect_format(upload.filename)), images)
+    return render_template('admin_import_products.html', report=report)
+
+@bp.route('/admin/products/export.<fmt>')
+@login_required
+def export_products(fmt):
+    if fmt not in catalog_io.FORMATS:
+        abort(404)
+    filename = f"menu_{local_now():%Y%m%d}.{fmt}"
+    return Response(stream_with_context(catalog_io.write_rows(catalog_export_rows(), fmt)),
+                    mimetype='text/csv' if fmt == 'csv' else 'application/json',
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+@bp.cli.command('import-catalog')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--images', type=click.Path(exists=True, dir_okay=False), help='Zip of the files named in the image column.')
+@click.option('--format', 'fmt', type=click.Choice(catalog_io.FORMATS), help='Default: from the file extension.')
+def import_catalog_command(path, images, fmt):
+    """Create or update categories and products from a CSV or JSON file."""
+    with open(path, encoding='utf-8-sig', newline='') as f, contextlib.ExitStack() as stack:
+        image_zip = stack.enter_context(zipfile.ZipFile(images)) if images else None
+        report = import_catalog(catalog_io.read_rows(f, fmt or catalog_io.detect_format(path)), image_zip)
+    for line, message in report.errors:
+        print(f"line {line}: {message}")
+    print(f"Created {report.created}, updated {report.updated} products; {report.error_count} rows skipped.")
+    # Let the queued image variant builds finish before the process exits
+    image_executor.shutdown(wait=True)
+
+@bp.cli.command('export-catalog')
+@click.option('--format', 'fmt', type=click.Choice(catalog_io.FORMATS), default='csv')
+@click.option('-o', '--output', type=click.File('w', encoding='utf-8', lazy=False), default='-')
+@click.option('--images', type=click.Path(dir_okay=False), help='Also write the product images to this zip.')
+def export_catalog_command(fmt, output, images):
+    """Write all categorised products as CSV or JSON, for import-catalog elsewhere."""
+    for chunk in catalog_io.write_rows(catalog_export_rows(), fmt):
+        output.write(chunk)
+    if images:
+        with zipfile.ZipFile(images, 'w', zipfile.ZIP_STORED) as image_zip:  # photos are compressed already
+            for (filename,) in db.session.query(Product.image).filter(Product.image.isnot(None)).distinct():
+                path = image_source_path(current_app.config, filename)
+                if path:
+                    image_zip.write(path, filename)
 
 # -------------------- CRUD: Tables --------------------
-@app.route('/admin/tables')
+@bp.route('/admin/tables')
 @login_required
 def admin_tables():
     tables = Table.query.all()
     return render_template('admin_tables.html', tables=tables)
 
-@app.route('/admin/tables/add', methods=['GET','POST'])
+@bp.route('/admin/tables/add', methods=['GET','POST'])
 @login_required
 def add_table():
     if request.method == 'POST':
         table = Table(name=request.form['name'])
         db.session.add(table)
         db.session.commit()
-        generate_table_qr(table.id)
-        return redirect(url_for('admin_tables'))
+        return redirect(url_for('main.admin_tables'))
     return render_template('admin_add_table.html')
 
-@app.route('/admin/tables/edit/<int:id>', methods=['GET','POST'])
+@bp.route('/admin/tables/edit/<int:id>', methods=['GET','POST'])
 @login_required
 def edit_table(id):
     table = Table.query.get_or_404(id)
     if request.method == 'POST':
         table.name = request.form['name']
         db.session.commit()
-        generate_table_qr(table.id)
-        return redirect(url_for('admin_tables'))
+        return redirect(url_for('main.admin_tables'))
     return render_template('admin_edit_table.html', table=table)
 
-@app.route('/admin/tables/delete/<int:id>')
+@bp.route('/admin/tables/delete/<int:id>')
 @login_required
 def delete_table(id):
     table = Table.query.get_or_404(id)
     remove_table_qr(table.id)
     db.session.delete(table)
     db.session.commit()
-    return redirect(url_for('admin_tables'))
+    return redirect(url_for('main.admin_tables'))
+
+@bp.route('/admin/tables/<int:id>/qr.<fmt>')
+@login_required
+def table_qr_image(id, fmt):
+    if fmt not in table_qr.QR_FORMATS:
+        return "Unsupported QR format", 404
+    table = Table.query.get_or_404(id)
+    etag = f"{table_qr.url_digest(table_qr_url(table.id))}-{fmt}"
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        response = send_from_directory(current_app.config['QRCODE_FOLDER'], os.path.basename(table_qr_path(table.id, fmt)),
+                                       mimetype=table_qr.QR_FORMATS[fmt], etag=False,
+                                       download_name=f"table_{table.id}.{fmt}")
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f'private, max-age={QR_MAX_AGE}'
+    return response
+
+@bp.route('/admin/tables/qr-sheet', methods=['POST'])
+@login_required
+def start_qr_sheet():
+    entries = [(t.name or f"Table {t.id}", table_qr_url(t.id)) for t in Table.query.order_by(Table.id).all()]
+    job_id = f"sheet_{table_qr.sheet_digest(entries)}.pdf"
+    if not os.path.exists(os.path.join(current_app.config['QRCODE_FOLDER'], job_id)):
+        with qr_sheet_lock:
+            if qr_sheet_jobs.get(job_id, {}).get('status') != 'running':
+                qr_sheet_jobs[job_id] = {'status': 'running', 'error': None}
+                qr_sheet_executor.submit(build_qr_sheet_job, current_app.config['QRCODE_FOLDER'], job_id, entries)
+    return qr_sheet_status(job_id)
+
+@bp.route('/admin/tables/qr-sheet/<job_id>')
+@login_required
+def qr_sheet_status(job_id):
+    job_id = secure_filename(job_id)
+    with qr_sheet_lock:
+        job = dict(qr_sheet_jobs.get(job_id) or {})
+    if not job:
+        if not os.path.exists(os.path.join(current_app.config['QRCODE_FOLDER'], job_id)):
+            return jsonify({'job_id': job_id, 'status': 'unknown'}), 404
+        job = {'status': 'done', 'url': url_for('static', filename='qrcodes/' + job_id)}
+    job['job_id'] = job_id
+    return jsonify(job)
 
 # -------------------- Admin Orders --------------------
-@app.route('/admin/orders')
+ORDERS_PER_PAGE = 50
+ORDER_STATUSES = ['pending', 'preparing', 'served', 'completed']
+
+def parse_order_cursor(cursor):
+    # Cursor is "<created_at iso>_<order id>" of the last row on the previous page
+    try:
+        created_at, order_id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(created_at), int(order_id)
+    except (AttributeError, ValueError):
+        return None
+
+def parse_date_arg(name):
+    try:
+        return datetime.strptime(request.args.get(name, ''), '%Y-%m-%d')
+    except ValueError:
+        return None
+
+@bp.route('/admin/orders')
 @login_required
 def admin_orders():
-    orders = Order.query.order_by(Order.created_at.desc()).all()
-    return render_template('admin_orders.html', orders=orders)
+    status = request.args.get('status') if request.args.get('status') in ORDER_STATUSES else None
+    date_from = parse_date_arg('date_from')
+    date_to = parse_date_arg('date_to')
+    cursor = parse_order_cursor(request.args.get('cursor'))
+    # 🔹 ?archived=1: purane completed orders jo archive mein chale gaye
+    archived = request.args.get('archived') == '1'
+    model, item_model = (ArchivedOrder, ArchivedOrderItem) if archived else (Order, OrderItem)
+
+    query = (db.session.query(model, order_total_column(model, item_model))
+             .options(joinedload(model.table))
+             .order_by(model.created_at.desc(), model.id.desc()))
+    if status:
+        query = query.filter(model.status == status)
+    if date_from:
+        query = query.filter(model.created_at >= date_from)
+    if date_to:
+        query = query.filter(model.created_at < date_to + timedelta(days=1))
+    if cursor:
+        created_at, order_id = cursor
+        query = query.filter(db.or_(model.created_at < created_at,
+                                    db.and_(model.created_at == created_at, model.id < order_id)))
+
+    rows = query.limit(ORDERS_PER_PAGE + 1).all()
+    next_cursor = None
+    if len(rows) > ORDERS_PER_PAGE:
+        rows = rows[:ORDERS_PER_PAGE]
+        last = rows[-1][0]
+        next_cursor = f"{last.created_at.isoformat()}_{last.id}"
+
+    return render_template('admin_orders.html', orders=rows, statuses=ORDER_STATUSES,
+                           status=status, date_from=request.args.get('date_from') if date_from else None,
+                           date_to=request.args.get('date_to') if date_to else None,
+                           next_cursor=next_cursor, is_first_page=cursor is None,
+                           archived='1' if archived else None)
+
+# -------------------- Order Placement --------------------
+OPEN_ORDER_STATUSES = ['pending', 'preparing']
+
+def begin_write_transaction():
+    # SQLite only locks the file on the first write, so two phones at the
+    # same table could both miss the open order and create one each.
+    # BEGIN IMMEDIATE takes the write lock before the lookup instead.
+    if db.engine.dialect.name == 'sqlite':
+        db.session.execute(db.text('BEGIN IMMEDIATE'))
+
+def place_order(table_id, cart):
+    """Add cart lines ({product_id: qty}) to the table's open order.
+
+    Products are resolved with one IN query and all items are upserted in a
+    single transaction. Returns the order, or None if nothing was orderable.
+    """
+    quantities = {}
+    for pid, qty in cart.items():
+        try:
+            pid, qty = int(pid), int(qty)
+        except (TypeError, ValueError):
+            continue
+        if qty > 0:
+            quantities[pid] = quantities.get(pid, 0) + qty
+    if not quantities:
+        return None
+
+    try:
+        begin_write_transaction()
+        products = Product.query.filter(Product.id.in_(quantities)).all()
+        if not products:
+            db.session.rollback()
+            return None
+
+        order = (Order.query.filter_by(table_id=table_id)
+                 .filter(Order.status.in_(OPEN_ORDER_STATUSES))
+                 .order_by(Order.id)
+                 .first())
+        if not order:
+            order = Order(table_id=table_id)
+            db.session.add(order)
+            db.session.flush()
+
+        rows = [{'order_id': order.id, 'product_id': product.id,
+                 'qty': quantities[product.id], 'price': product.price * quantities[product.id]}
+                for product in products]
+        if db.engine.dialect.name == 'sqlite':
+            # One INSERT .. ON CONFLICT for all lines, relying on uq_order_item_order_product
+            stmt = sqlite_insert(OrderItem).values(rows)
+            unit_price = stmt.excluded.price / stmt.excluded.qty
+            db.session.execute(stmt.on_conflict_do_update(
+                index_elements=['order_id', 'product_id'],
+                set_={'qty': OrderItem.qty + stmt.excluded.qty,
+                      'price': (OrderItem.qty + stmt.excluded.qty) * unit_price}))
+        else:
+            existing = {item.product_id: item for item in
+                        OrderItem.query.filter(OrderItem.order_id == order.id,
+                                               OrderItem.product_id.in_(quantities)).all()}
+            for row in rows:
+                item = existing.get(row['product_id'])
+                if item:
+                    item.qty = (item.qty or 0) + row['qty']
+                    item.price = item.qty * row['price'] / row['qty']
+                else:
+                    db.session.add(OrderItem(**row))
+        kitchen_board.record(order.id)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return order
+
+def notify_new_order(order):
+    emit_order_event('new_order', {
+        'order_id': order.id,
+        'table_id': order.table_id,
+        'status': order.status,
+        'created_at': order.created_at.strftime('%Y-%m-%d %H:%M:%S')
+    }, order.table_id)
+
+# -------------------- Kitchen Display --------------------
+KDS_STATUSES = ['pending', 'preparing', 'served']
+KDS_LOG_SIZE = 2000
+KDS_PRUNE_EVERY = 100
+
+class KitchenBoard:
+    """Open orders for the kitchen display, plus a numbered log of changes.
+
+    Each change is stored as a KdsEvent, so the sequence comes from the
+    database and is shared by every worker. A screen that reconnects with its
+    last seq only receives what it missed, or a snapshot once the log has
+    been pruned past it.
+
+    Events are added in the transaction that changes the order, so a change
+    and its seq commit together; the delta goes out after that commit.
+    """
+
+    def __init__(self, log_size):
+        self.log_size = log_size
+
+    @staticmethod
+    def ticket(order):
+        return {
+            'id': order.id,
+            'table_id': order.table_id,
+            'table': order.table.name if order.table else '',
+            'status': order.status,
+            'created_at': order.created_at.strftime('%Y-%m-%d %H:%M:%S') if order.created_at else None,
+            'items': [{'name': item.product.name if item.product else '', 'qty': item.qty}
+                      for item in order.order_items]
+        }
+
+    @staticmethod
+    def load_orders(*criteria, populate_existing=False):
+        return (Order.query
+                .options(joinedload(Order.table),
+                         selectinload(Order.order_items).joinedload(OrderItem.product))
+                .execution_options(populate_existing=populate_existing)
+                .filter(Order.status.in_(KDS_STATUSES), *criteria)
+                .order_by(Order.created_at, Order.id)
+                .all())
+
+    @staticmethod
+    def last_seq():
+        return db.session.query(db.func.max(KdsEvent.seq)).scalar() or 0
+
+    def snapshot(self):
+        # seq is read first, so a change racing the snapshot is re-sent rather than lost
+        seq = self.last_seq()
+        return {'seq': seq, 'orders': [self.ticket(o) for o in self.load_orders()]}
+
+    def since(self, seq):
+        """Deltas after seq, or None if the screen has to take a snapshot."""
+        if not isinstance(seq, int):
+            return None
+        last = self.last_seq()
+        if seq > last:
+            return None
+        if seq == last:
+            return []
+        events = KdsEvent.query.filter(KdsEvent.seq > seq).order_by(KdsEvent.seq).all()
+        if not events or events[0].seq != seq + 1:
+            return None
+        return [dict(json.loads(event.payload), seq=event.seq) for event in events]
+
+    def _log(self, op, **fields):
+        delta = dict(fields, op=op)
+        event = KdsEvent(payload=json.dumps(delta))
+        db.session.add(event)
+        db.session.flush()
+        if event.seq % KDS_PRUNE_EVERY == 0:
+            KdsEvent.query.filter(KdsEvent.seq <= event.seq - self.log_size).delete()
+        delta['seq'] = event.seq
+        db.session.info.setdefault('kds_deltas', []).append(delta)
+
+    def record(self, order_id):
+        """Log an order's current ticket, or its removal, in the open transaction."""
+        # populate_existing: items may have been upserted with a Core INSERT in this transaction
+        orders = self.load_orders(Order.id == order_id, populate_existing=True)
+        if orders:
+            self._log('upsert', order=self.ticket(orders[0]))
+        else:
+            self._log('remove', order_id=order_id)
+
+    def set_status(self, order_id, status):
+        if status in KDS_STATUSES:
+            self.record(order_id)
+        else:
+            self._log('remove', order_id=order_id)
+
+kitchen_board = KitchenBoard(KDS_LOG_SIZE)
+
+@event.listens_for(db.session, 'after_commit')
+def send_kds_deltas(session):
+    for delta in session.info.pop('kds_deltas', ()):
+        try:
+            socketio.emit('kds_delta', delta, to=KITCHEN_ROOM)
+        except Exception:
+            pass
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def drop_kds_deltas(session, previous_transaction):
+    session.info.pop('kds_deltas', None)
+
+@socketio.on('kds_sync')
+@timed_socket_handler('kds_sync')
+def handle_kds_sync(data):
+    """A kitchen screen (re)connected; send what it missed or a snapshot."""
+    if not current_user.is_authenticated:
+        return
+    data = data if isinstance(data, dict) else {}
+    deltas = kitchen_board.since(data.get('seq'))
+    if deltas is None:
+        emit('kds_snapshot', kitchen_board.snapshot())
+    else:
+        emit('kds_deltas', {'deltas': deltas})
+
+@bp.route('/kitchen')
+@login_required
+def kitchen_display():
+    return render_template('kds.html', statuses=KDS_STATUSES)
+
+# -------------------- Cart Store --------------------
+# The store is created per app in create_app()
+carts = LocalProxy(lambda: current_app.extensions['carts'])
+
+def cart_key(table_id, create=True):
+    # One cart per table unless CART_SCOPE=device; the cookie then only holds an id
+    if current_app.config['CART_SCOPE'] == 'device':
+        if 'cart_id' not in session:
+            if not create:
+                return None
+            session['cart_id'] = uuid.uuid4().hex
+        return f"{table_id}:{session['cart_id']}"
+    return str(table_id)
+
+def cart_lines(cart, catalog):
+    cart_items, total_price = [], 0
+    for pid, qty in cart.items():
+        product = catalog.products_by_id.get(pid)
+        if product:
+            subtotal = product.price * qty
+            cart_items.append({'product': product, 'qty': qty, 'subtotal': subtotal})
+            total_price += subtotal
+    return cart_items, total_price
+
+def notify_cart_updated(key, cart=None):
+    try:
+        socketio.emit('cart_updated', {
+            'cart_key': key,
+            'cart': {str(pid): qty for pid, qty in (carts.get(key) if cart is None else cart).items()}
+        }, to=f"cart:{key}")
+    except Exception:
+        pass
+
+def checkout_cart(table_id, key):
+    """Take the cart and turn it into an order; the cart is restored on failure."""
+    cart = carts.take(key)
+    try:
+        order = place_order(table_id, cart)
+    except Exception:
+        for pid, qty in cart.items():
+            carts.incr(key, pid, qty)
+        raise
+    notify_cart_updated(key, {})
+    if order:
+        notify_new_order(order)
+    return order, cart
+
+@socketio.on('join_cart')
+@timed_socket_handler('join_cart')
+def handle_join_cart(data):
+    # The key comes from this browser's session, so a device cart stays private to it
+    if not isinstance(data, dict):
+        return
+    try:
+        table_id = int(data.get('table_id'))
+    except (TypeError, ValueError):
+        return
+    key = cart_key(table_id, create=False)
+    if key:
+        join_room(f"cart:{key}")
+
+# -------------------- Product Search --------------------
+SEARCH_MAX_PER_PAGE = 100
+
+def search_args():
+    """Menu search filters from the query string, under their URL names."""
+    return {
+        'q': request.args.get('q', '').strip()[:100] or None,
+        'category_id': request.args.get('category_id', type=int),
+        'min_price': request.args.get('min_price', type=float),
+        'max_price': request.args.get('max_price', type=float),
+        'page': request.args.get('page', 1, type=int),
+    }
+
+def search_menu(catalog, args, per_page):
+    result = catalog.search_index.search(args['q'], args['category_id'], args['min_price'],
+                                         args['max_price'], args['page'], per_page)
+    category_facets = [(c, result.category_counts[c.id]) for c in catalog.categories
+                       if result.category_counts.get(c.id)]
+    price_facets = [(low, high, count) for (low, high), count
+                    in zip(product_search.PRICE_RANGES, result.price_counts) if count]
+    return result, category_facets, price_facets
+
+# -------------------- Menu Fragments --------------------
+# Between two renders of the same menu page only the cart quantities differ,
+# so each category block is rendered once per catalog snapshot with a slot
+# where every quantity goes. Catalog edits replace the snapshot and with it
+# these blocks.
+MENU_FRAGMENT_LIMIT = 1000  # blocks kept per snapshot; searches produce many distinct pages
+
+menu_fragments = metrics_registry.counter(
+    'menu_fragments_total', 'Menu category blocks served from cache or rendered.', ['result'])
+
+def menu_category_block(catalog, category, products):
+    """menu_category.html for these products as [html, product_id, html, ..., html]."""
+    cache = current_app.config['MENU_FRAGMENT_CACHE']
+    key = (category.id, tuple(p.id for p in products))
+    parts = catalog.fragments.get(key) if cache else None
+    if parts is not None:
+        menu_fragments.inc('hit')
+        return parts
+    menu_fragments.inc('miss')
+    # Slots are a random token per render, so no product or category name can fake one
+    token, slot_ids = uuid.uuid4().hex, []
+
+    def qty_slot(product_id):
+        slot_ids.append(product_id)
+        return Markup(token)
+
+    pieces = render_template('menu_category.html', category=category, products=products,
+                             qty_slot=qty_slot).split(token)
+    parts = pieces[:1]
+    for product_id, piece in zip(slot_ids, pieces[1:]):
+        parts += [product_id, piece]
+    if cache and len(catalog.fragments) < MENU_FRAGMENT_LIMIT:
+        catalog.fragments[key] = parts
+    return parts
+
+def fill_quantities(parts, cart):
+    return Markup(''.join(str(cart.get(part, 0)) if i % 2 else part for i, part in enumerate(parts)))
 
 # -------------------- Customer Menu --------------------
-@app.route('/menu/<int:table_id>', methods=['GET', 'POST'])
+@bp.route('/menu/<int:table_id>', methods=['GET', 'POST'])
 def menu(table_id):
     table = Table.query.get_or_404(table_id)
-    categories = Category.query.all()
-    products = Product.query.all()
-
-    if 'cart' not in session:
-        session['cart'] = {}
+    catalog = catalog_cache.get()
+    key = cart_key(table.id)
 
     if request.method == 'POST':
         action = request.form.get('action')
-        pid = request.form.get('product_id')
+        pid = request.form.get('product_id', type=int)
 
-        if pid:
-            pid = str(pid)
-            if action == 'increase':
-                session['cart'][pid] = session['cart'].get(pid, 0) + 1
-            elif action == 'decrease':
-                if session['cart'].get(pid, 0) > 1:
-                    session['cart'][pid] -= 1
-                else:
-                    session['cart'].pop(pid, None)
-            session.modified = True
+        if pid and action in ('increase', 'decrease'):
+            carts.incr(key, pid, 1 if action == 'increase' else -1)
+            notify_cart_updated(key)
 
         if action == 'go_to_cart':
-            return redirect(url_for('cart', table_id=table_id))
+            return redirect(url_for('main.cart', table_id=table_id))
 
         if action == 'place_order':
-            cart = session.get('cart', {})
-            if not cart:
-                flash("Cart is empty!", "warning")
-                return redirect(url_for('menu', table_id=table_id))
-
-            order = Order.query.filter_by(table_id=table.id).filter(Order.status.in_(['pending','preparing'])).first()
+            order, _ = checkout_cart(table.id, key)
             if not order:
-                order = Order(table_id=table.id)
-                db.session.add(order)
-                db.session.commit()
-
-            for pid_str, qty in cart.items():
-                if not qty:
-                    continue
-                existing = OrderItem.query.filter_by(order_id=order.id, product_id=product.id).first()
-                if existing:
-                    existing.qty = (existing.qty or 0) + qty
-                    existing.price = existing.qty * product.price
-                else:
-                    db.session.add(OrderItem(order_id=order.id,
-                                             product_id=product.id,
-                                             qty=qty,
-                                             price=product.price * qty))
-            db.session.commit()
-
-            try:
-                socketio.emit('new_order', {
-                    'order_id': order.id,
-                    'table_id': order.table_id,
-                    'status': order.status,
-                    'created_at': order.created_at.strftime('%Y-%m-%d %H:%M:%S')
-                }, broadcast=True)
-            except Exception:
-                pass
+                flash("Cart is empty!", "warning")
+                return redirect(url_for('main.menu', table_id=table_id))
 
-            session['cart'] = {}
-            session.modified = True
             flash("Order placed successfully!", "success")
-            return redirect(url_for('my_orders', table_id=table_id))
+            return redirect(url_for('main.my_orders', table_id=table_id))
 
+    cart = carts.get(key)
     cart_items = {}
-    for pid, qty in session.get('cart', {}).items():
-        product = Product.query.get(int(pid))
+    for pid, qty in cart.items():
+        product = catalog.products_by_id.get(pid)
         if product:
             cart_items[pid] = {'product': product, 'qty': qty}
 
-    return render_template('menu.html', table=table, categories=categories,
-                           products=products, cart=session.get('cart', {}), cart_items=cart_items)
+    # 🔹 Ek page par MENU_PAGE_SIZE items hi, search aur filters ke saath
+    search = search_args()
+    result, category_facets, price_facets = search_menu(catalog, search, current_app.config['MENU_PAGE_SIZE'])
+    by_category = {}
+    for product in result.products:
+        by_category.setdefault(product.category_id, []).append(product)
+    category_blocks = [fill_quantities(menu_category_block(catalog, category, by_category[category.id]), cart)
+                       for category in catalog.categories if category.id in by_category]
+    return render_template('menu.html', table=table, category_blocks=category_blocks,
+                           products=result.products, cart=cart, cart_items=cart_items, cart_key=key,
+                           search=search, result=result, category_facets=category_facets,
+                           price_facets=price_facets)
 
 # -------------------- Cart --------------------
-@app.route('/cart/<int:table_id>', methods=['GET','POST'])
+@bp.route('/cart/<int:table_id>', methods=['GET','POST'])
 def cart(table_id):
     table = Table.query.get_or_404(table_id)
-    cart = session.get('cart', {})
-    cart_items, total_price = [], 0
-
-    for pid, qty in cart.items():
-        product = Product.query.get(int(pid))
-        if product:
-            subtotal = product.price * qty
-            cart_items.append({'product': product, 'qty': qty, 'subtotal': subtotal})
-            total_price += subtotal
+    catalog = catalog_cache.get()
+    key = cart_key(table.id)
 
     if request.method == 'POST':
         action = request.form.get('action')
-        pid = request.form.get('product_id')
+        pid = request.form.get('product_id', type=int)
 
         if pid:
-            pid = str(pid)
             if action == 'increase':
-                session['cart'][pid] = session['cart'].get(pid, 0) + 1
-            elif action == 'decrease' and session['cart'].get(pid, 0) > 1:
-                session['cart'][pid] -= 1
+                carts.incr(key, pid, 1)
+            elif action == 'decrease':
+                carts.incr(key, pid, -1, min_qty=1)
             elif action == 'remove':
-                session['cart'].pop(pid, None)
-            session.modified = True
-            return redirect(url_for('cart', table_id=table_id))
-
-        if action == 'place_order' and cart_items:
-            order = Order.query.filter_by(table_id=table.id).filter(Order.status.in_(['pending','preparing'])).first()
-            if not order:
-                order = Order(table_id=table.id)
-                db.session.add(order)
-                db.session.commit()
+                carts.remove(key, pid)
+            notify_cart_updated(key)
+            return redirect(url_for('main.cart', table_id=table_id))
 
-            for item in cart_items:
-                product = item['product']
-                existing = OrderItem.query.filter_by(order_id=order.id, product_id=product.id).first()
-                if existing:
-                    existing.qty = (existing.qty or 0) + item['qty']
-                    existing.price = existing.qty * product.price
-                else:
-                    db.session.add(OrderItem(order_id=order.id,
-                                             product_id=product.id,
-                                             qty=item['qty'],
-                                             price=item['subtotal']))
-            db.session.commit()
-
-            try:
-                socketio.emit('new_order', {
-                    'order_id': order.id,
-                    'table_id': order.table_id,
-                    'status': order.status,
-                    'created_at': order.created_at.strftime('%Y-%m-%d %H:%M:%S')
-                }, broadcast=True)
-            except Exception:
-                pass
-
-            session['cart'] = {}
-            session.modified = True
-            flash(f"Order placed! Total ₹{total_price}", "success")
-            return redirect(url_for('my_orders', table_id=table_id))
-
-    return render_template('cart.html', table=table, cart_items=cart_items, total_price=total_price)
+        if action == 'place_order':
+            order, placed = checkout_cart(table.id, key)
+            if order:
+                _, total_price = cart_lines(placed, catalog)
+                flash(f"Order placed! Total ₹{total_price}", "success")
+                return redirect(url_for('main.my_orders', table_id=table_id))
+
+    cart = carts.get(key)
+    cart_items, total_price = cart_lines(cart, catalog)
+    return render_template('cart.html', table=table, cart_items=cart_items, total_price=total_price,
+                           cart_key=key, cart_state={str(pid): qty for pid, qty in cart.items()})
+
+# -------------------- JSON API --------------------
+def api_error(message, status=400):
+    return jsonify({'error': message}), status
+
+def product_image_url(product):
+    return product_image_variant(product, 'card', 'jpeg')
+
+@bp.route('/api/menu')
+def api_menu():
+    catalog = catalog_cache.get()
+    if request.if_none_match.contains(catalog.etag):
+        response = make_response('', 304)
+    else:
+        if catalog.menu_json is None:
+            catalog.menu_json = current_app.json.dumps({
+                'version': catalog.etag,
+                'categories': [{
+                    'id': c.id,
+                    'name': c.name,
+                    'products': [{'id': p.id, 'name': p.name, 'price': p.price, 'image': product_image_url(p)}
+                                 for p in catalog.products_by_category.get(c.id, [])]
+                } for c in catalog.categories]
+            })
+        response = make_response(catalog.menu_json)
+        response.mimetype = 'application/json'
+    response.set_etag(catalog.etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@bp.route('/api/menu/search')
+def api_menu_search():
+    catalog = catalog_cache.get()
+    search = search_args()
+    per_page = min(max(request.args.get('per_page', current_app.config['MENU_PAGE_SIZE'], type=int), 1),
+                   SEARCH_MAX_PER_PAGE)
+    result, category_facets, price_facets = search_menu(catalog, search, per_page)
+    response = jsonify({
+        'version': catalog.etag,
+        'q': search['q'],
+        'total': result.total,
+        'page': result.page,
+        'pages': result.pages,
+        'per_page': result.per_page,
+        'products': [{'id': p.id, 'name': p.name, 'price': p.price, 'category_id': p.category_id,
+                      'image': product_image_url(p)} for p in result.products],
+        'facets': {
+            'categories': [{'id': c.id, 'name': c.name, 'count': count} for c, count in category_facets],
+            'prices': [{'min': low, 'max': high, 'count': count} for low, high, count in price_facets],
+        },
+    })
+    response.set_etag(hashlib.sha1(f"{catalog.etag}?{request.query_string.decode('latin-1')}"
+                                   .encode('utf-8')).hexdigest()[:20])
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+def cart_payload(key, catalog):
+    cart = carts.get(key)
+    cart_items, total_price = cart_lines(cart, catalog)
+    return {
+        'cart_key': key,
+        'items': {str(item['product'].id): {'qty': item['qty'], 'subtotal': item['subtotal']}
+                  for item in cart_items},
+        'count': sum(item['qty'] for item in cart_items),
+        'total': total_price
+    }
+
+@bp.route('/api/cart/<int:table_id>')
+def api_cart(table_id):
+    table = db.session.get(Table, table_id)
+    if not table:
+        return api_error("Unknown table", 404)
+    return jsonify(cart_payload(cart_key(table.id), catalog_cache.get()))
+
+@bp.route('/api/cart/<int:table_id>/items', methods=['POST'])
+def api_cart_item(table_id):
+    """Change one cart line: {"product_id": 3, "delta": 1|-1, "min_qty": 0} or {"product_id": 3, "remove": true}."""
+    table = db.session.get(Table, table_id)
+    if not table:
+        return api_error("Unknown table", 404)
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return api_error("Expected a JSON object")
+    catalog = catalog_cache.get()
+    try:
+        pid = int(data.get('product_id'))
+        delta = int(data.get('delta', 0))
+        min_qty = int(data.get('min_qty', 0))
+    except (TypeError, ValueError):
+        return api_error("product_id, delta and min_qty must be integers")
+    product = catalog.products_by_id.get(pid)
+    if not product:
+        return api_error("Unknown product", 404)
+
+    key = cart_key(table.id)
+    if data.get('remove'):
+        carts.remove(key, pid)
+        qty = 0
+    else:
+        qty = carts.incr(key, pid, delta, min_qty=min_qty)
+    payload = cart_payload(key, catalog)
+    notify_cart_updated(key, {int(k): v['qty'] for k, v in payload['items'].items()})
+    return jsonify({
+        'product_id': pid,
+        'qty': qty,
+        'subtotal': product.price * qty,
+        'count': payload['count'],
+        'total': payload['total']
+    })
+
+@bp.route('/api/orders', methods=['POST'])
+def api_place_order():
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return api_error("Expected a JSON object")
+    try:
+        table_id = int(data.get('table_id'))
+    except (TypeError, ValueError):
+        return api_error("table_id must be an integer")
+    table = db.session.get(Table, table_id)
+    if not table:
+        return api_error("Unknown table", 404)
+    order, placed = checkout_cart(table.id, cart_key(table.id))
+    if not order:
+        return api_error("Cart is empty!")
+    _, total_price = cart_lines(placed, catalog_cache.get())
+    flash(f"Order placed! Total ₹{total_price}", "success")
+    return jsonify({
+        'order_id': order.id,
+        'status': order.status,
+        'total': total_price,
+        'redirect': url_for('main.my_orders', table_id=table.id)
+    }), 201
 
 # -------------------- My Orders --------------------
-@app.route('/my_orders/<int:table_id>')
+@bp.route('/my_orders/<int:table_id>')
 def my_orders(table_id):
     table = Table.query.get_or_404(table_id)
-    orders = Order.query.filter_by(table_id=table.id).filter(Order.status != 'completed').order_by(Order.created_at.desc()).all()
+    orders = (db.session.query(Order, order_total_column())
+              .options(selectinload(Order.order_items).joinedload(OrderItem.product))
+              .filter(Order.table_id == table.id, Order.status != 'completed')
+              .order_by(Order.created_at.desc())
+              .all())
     return render_template('my_orders.html', table=table, orders=orders)
 
 # -------------------- Bill Generation --------------------
-@app.route('/admin/bill/view/<int:order_id>')
+@bp.route('/admin/bill/view/<int:order_id>')
 @login_required
 def view_bill(order_id):
-    order = Order.query.get_or_404(order_id)
+    order = find_order(order_id)
     total_price = sum(item.price for item in order.order_items)
     return render_template('bill.html', order=order, order_items=order.order_items, total_price=total_price)
 
 
-@app.route('/admin/bill/download/<int:order_id>')
-@login_required
-def download_bill(order_id):
-    order = Order.query.get_or_404(order_id)
-    order_items = OrderItem.query.filter_by(order_id=order.id).all()
-    total_price = sum(item.price for item in order_items)
-
-    # 🔹 Ab hum wahi bill.html ko render karenge jo view karta hai
+# wkhtmltopdf runs in these threads so a render never blocks the eventlet hub
+bill_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='bill-render')
+bill_jobs = {}
+bill_jobs_lock = threading.Lock()
+
+def bill_filename(order, order_items):
+    """Cache file name: order id plus a hash of what is printed on the bill."""
+    digest = hashlib.sha1()
+    digest.update(f"{order.table.name if order.table else ''};".encode())
+    for item in sorted(order_items, key=lambda i: i.id):
+        digest.update(f"{item.product_id}:{item.qty}:{item.price:.2f};".encode())
+    return f"bill_{order.id}_{digest.hexdigest()[:16]}.pdf"
+
+def mark_order_completed(order):
+    if order.status == 'completed':
+        return
+    order.status = 'completed'
+    record_order_rollup(order, local_now())
+    kitchen_board.set_status(order.id, order.status)
+    db.session.commit()
+    emit_order_event('order_completed', {
+        'order_id': order.id,
+        'table_id': order.table_id
+    }, order.table_id)
+
+def set_bill_job(job_id, **fields):
+    with bill_jobs_lock:
+        bill_jobs.setdefault(job_id, {}).update(fields)
+
+def submit_bill_render(order, order_items, job_id):
+    """Queue a PDF render for job_id unless one is already queued or running."""
+    with bill_jobs_lock:
+        job = bill_jobs.get(job_id)
+        if job and job['status'] in ('queued', 'rendering'):
+            return
+        bill_jobs[job_id] = {'status': 'queued', 'order_id': order.id, 'error': None}
+
+    # Templates need the request context, so render the HTML here and only
+    # hand the HTML -> PDF conversion to the pool.
     rendered_html = render_template(
         "bill.html",
         order=order,
         order_items=order_items,
-        total_price=total_price
+        total_price=sum(item.price for item in order_items)
     )
+    bill_executor.submit(render_bill_job, current_app._get_current_object(), job_id, order.id, rendered_html)
+
+def render_bill_job(app, job_id, order_id, rendered_html):
+    set_bill_job(job_id, status='rendering')
+    folder = app.config['BILLS_FOLDER']
+    path = os.path.join(folder, job_id)
+    # Write to a hidden file first so a half-written PDF is never served
+    tmp_path = os.path.join(folder, '.' + job_id)
+    try:
+        started = time.perf_counter()
+        pdfkit.from_string(
+            rendered_html,
+            tmp_path,
+            options={"enable-local-file-access": ""},
+            configuration=get_pdfkit_config()
+        )
+        bill_render_seconds.observe(time.perf_counter() - started, 'wkhtmltopdf')
+        os.replace(tmp_path, path)
+    except Exception as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        set_bill_job(job_id, status='failed', error=str(e))
+        return
+
+    # Older renders of this order are stale now
+    prefix = f"bill_{order_id}_"
+    for name in os.listdir(folder):
+        if name.startswith(prefix) and name != job_id:
+            try:
+                os.remove(os.path.join(folder, name))
+            except OSError:
+                pass
 
-    # 🔹 HTML ko PDF me convert karo
-    pdf = pdfkit.from_string(
-        rendered_html,
-        False,
-        options={"enable-local-file-access": ""},
-        configuration=config
+    with app.app_context():
+        order = db.session.get(Order, order_id)
+        if order:
+            mark_order_completed(order)
+
+    with bill_jobs_lock:
+        bill_jobs.pop(job_id, None)
+
+def build_receipt(order, order_items):
+    return receipt.Receipt(
+        order_id=order.id,
+        table=order.table.name if order.table else '',
+        created_at=order.created_at,
+        items=[receipt.ReceiptItem(item.product.name if item.product else '', item.qty, item.price)
+               for item in order_items],
+        total=sum(item.price for item in order_items)
     )
 
-    if pdf:
-        # Status complete kar do
-        order.status = "completed"
-        db.session.commit()
-
-        try:
-            socketio.emit('order_completed', {
-                'order_id': order.id,
-                'table_id': order.table_id
-            }, broadcast=True)
-        except Exception:
-            pass
-
-        # 🔹 PDF return karo as download
-        response = make_response(pdf)
-        response.headers['Content-Type'] = 'application/pdf'
-        response.headers['Content-Disposition'] = f'attachment; filename=bill_{order.id}.pdf'
+@bp.route('/admin/bill/download/<int:order_id>')
+@login_required
+def download_bill(order_id):
+    order = find_order(order_id)
+    item_model = order_item_model(order)
+    order_items = (item_model.query.options(joinedload(item_model.product))
+                   .filter_by(order_id=order.id).all())
+
+    # 🔹 ?format=text|escpos|png|pdf ya BILL_RENDERER=native: wkhtmltopdf ke bina receipt
+    fmt = request.args.get('format')
+    if fmt in receipt.RECEIPT_FORMATS or current_app.config['BILL_RENDERER'] == 'native':
+        fmt = fmt if fmt in receipt.RECEIPT_FORMATS else 'pdf'
+        started = time.perf_counter()
+        body = receipt.render(build_receipt(order, order_items), fmt, current_app.config['BILL_WIDTH_MM'])
+        bill_render_seconds.observe(time.perf_counter() - started, 'native')
+        mark_order_completed(order)
+        content_type, ext = receipt.RECEIPT_FORMATS[fmt]
+        response = make_response(body)
+        response.headers['Content-Type'] = content_type
+        response.headers['Content-Disposition'] = f'attachment; filename=bill_{order.id}.{ext}'
         return response
 
-    flash("Could not generate PDF.", "danger")
-    return redirect(url_for('view_bill', order_id=order.id))
+    filename = bill_filename(order, order_items)
 
+    # 🔹 Bill pehle se render hai to seedha disk se bhejo
+    if os.path.exists(os.path.join(current_app.config['BILLS_FOLDER'], filename)):
+        mark_order_completed(order)
+        return send_from_directory(current_app.config['BILLS_FOLDER'], filename,
+                                   as_attachment=True, download_name=f'bill_{order.id}.pdf')
 
+    submit_bill_render(order, order_items, filename)
+    return render_template('bill_pending.html', order=order, job_id=filename)
+
+@bp.route('/admin/bill/jobs/<job_id>')
+@login_required
+def bill_job_status(job_id):
+    with bill_jobs_lock:
+        job = dict(bill_jobs.get(job_id) or {})
+    if not job:
+        if not os.path.exists(os.path.join(current_app.config['BILLS_FOLDER'], secure_filename(job_id))):
+            return jsonify({'job_id': job_id, 'status': 'unknown'}), 404
+        job['status'] = 'done'
+    job['job_id'] = job_id
+    return jsonify(job)
 
 # -------------------- SocketIO --------------------
 @socketio.on('update_order_status')
+@timed_socket_handler('update_order_status')
 def handle_update_order_status(data):
+    # Customer phones are connected too now; only staff may change a status
+    if not current_user.is_authenticated:
+        return
     order = Order.query.get(data.get('order_id'))
     if order:
         order.status = data.get('status', order.status)
+        if order.status == 'completed':
+            record_order_rollup(order, local_now())
+        kitchen_board.set_status(order.id, order.status)
+        db.session.commit()
+        status_batcher.add(order.id, order.table_id, order.status)
+
+# -------------------- Analytics --------------------
+ROLLUP_PERIODS = ['hour', 'day']
+ROLLUP_PERIOD_LABELS = {'hour': 'Hourly', 'day': 'Daily'}
+ROLLUP_DIMENSIONS = ['total', 'product', 'category', 'table']
+ROLLUP_BATCH_SIZE = 500
+
+def local_now():
+    # Naive local time, the same way created_at comes back from SQLite
+    return datetime.now(pytz.timezone("Asia/Kolkata")).replace(tzinfo=None)
+
+def rollup_bucket(moment, period):
+    if period == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def record_order_rollup(order, completed_at=None):
+    """Add a completed order to the hourly and daily rollups, once per order.
+
+    Runs in the caller's transaction so the status change and the rollup
+    commit together. Without completed_at (backfill) the order is left out
+    of the turnaround average.
+    """
+    if isinstance(order, ArchivedOrder):
+        claimed = True  # only rebuild_rollups() passes these, right after clearing everything
+    elif db.engine.dialect.name == 'sqlite':
+        claimed = db.session.execute(sqlite_insert(RolledUpOrder).values(order_id=order.id)
+                                     .on_conflict_do_nothing()).rowcount
+    else:
+        claimed = db.session.get(RolledUpOrder, order.id) is None
+        if claimed:
+            db.session.add(RolledUpOrder(order_id=order.id))
+    if not claimed or order.created_at is None:
+        return
+
+    created_at = order.created_at.replace(tzinfo=None)
+    turnaround = max((completed_at - created_at).total_seconds(), 0) if completed_at else None
+    item_model = order_item_model(order)
+    lines = (db.session.query(item_model.product_id, Product.category_id, item_model.qty, item_model.price)
+             .outerjoin(Product, Product.id == item_model.product_id)
+             .filter(item_model.order_id == order.id).all())
+
+    # (dimension, dim_key) -> [revenue, quantity]
+    totals = {('total', 0): [0, 0], ('table', order.table_id or 0): [0, 0]}
+    for product_id, category_id, qty, price in lines:
+        for key in (('total', 0), ('table', order.table_id or 0),
+                    ('product', product_id or 0), ('category', category_id or 0)):
+            entry = totals.setdefault(key, [0, 0])
+            entry[0] += price or 0
+            entry[1] += qty or 0
+
+    rows = []
+    for period in ROLLUP_PERIODS:
+        bucket = rollup_bucket(created_at, period)
+        for (dimension, dim_key), (revenue, quantity) in totals.items():
+            # Turnaround is a property of the order, not of its lines
+            timed = turnaround is not None and dimension in ('total', 'table')
+            rows.append({'period': period, 'bucket': bucket, 'dimension': dimension, 'dim_key': dim_key,
+                         'revenue': revenue, 'quantity': quantity, 'orders': 1,
+                         'turnaround_seconds': turnaround if timed else 0,
+                         'turnaround_orders': 1 if timed else 0})
+    counters = ['revenue', 'quantity', 'orders', 'turnaround_seconds', 'turnaround_orders']
+    if db.engine.dialect.name == 'sqlite':
+        stmt = sqlite_insert(SalesRollup).values(rows)
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=['period', 'dimension', 'bucket', 'dim_key'],
+            set_={name: getattr(SalesRollup, name) + getattr(stmt.excluded, name) for name in counters}))
+    else:
+        for row in rows:
+            rollup = SalesRollup.query.filter_by(period=row['period'], dimension=row['dimension'],
+                                                 bucket=row['bucket'], dim_key=row['dim_key']).first()
+            if rollup is None:
+                db.session.add(SalesRollup(**row))
+            else:
+                for name in counters:
+                    setattr(rollup, name, getattr(rollup, name) + row[name])
+
+def rebuild_rollups():
+    """Recompute all rollups from the completed orders, live and archived."""
+    SalesRollup.query.delete()
+    RolledUpOrder.query.delete()
+    db.session.commit()
+    for model in (Order, ArchivedOrder):
+        last_id = 0
+        while True:
+            batch = (model.query.filter(model.status == 'completed', model.id > last_id)
+                     .order_by(model.id).limit(ROLLUP_BATCH_SIZE).all())
+            if not batch:
+                break
+            for order in batch:
+                record_order_rollup(order)
+            db.session.commit()
+            last_id = batch[-1].id
+
+def sales_report(period, dimension, start, end, by_bucket=False):
+    """Summed rollups for [start, end), one row per dim_key (and bucket)."""
+    columns = [SalesRollup.dim_key,
+               db.func.sum(SalesRollup.revenue).label('revenue'),
+               db.func.sum(SalesRollup.quantity).label('quantity'),
+               db.func.sum(SalesRollup.orders).label('orders'),
+               db.func.sum(SalesRollup.turnaround_seconds).label('turnaround_seconds'),
+               db.func.sum(SalesRollup.turnaround_orders).label('turnaround_orders')]
+    group_by = [SalesRollup.dim_key]
+    if by_bucket:
+        columns.insert(0, SalesRollup.bucket)
+        group_by.insert(0, SalesRollup.bucket)
+    query = (db.session.query(*columns)
+             .filter(SalesRollup.period == period, SalesRollup.dimension == dimension,
+                     SalesRollup.bucket >= start, SalesRollup.bucket < end)
+             .group_by(*group_by))
+    if by_bucket:
+        return query.order_by(SalesRollup.bucket, SalesRollup.dim_key).all()
+    return query.order_by(db.func.sum(SalesRollup.revenue).desc()).all()
+
+def average_turnaround_minutes(row):
+    if not row.turnaround_orders:
+        return None
+    return row.turnaround_seconds / row.turnaround_orders / 60
+
+def report_labels(dimension):
+    # Deleted products/tables keep their rollups; they fall back to "#id"
+    if dimension == 'product':
+        return {p.id: p.name for p in catalog_cache.get().products}
+    if dimension == 'category':
+        return {c.id: c.name for c in catalog_cache.get().categories}
+    if dimension == 'table':
+        return dict(db.session.query(Table.id, Table.name).all())
+    return {0: 'All orders'}
+
+def report_range():
+    today = rollup_bucket(local_now(), 'day')
+    date_from = parse_date_arg('date_from') or today - timedelta(days=6)
+    date_to = parse_date_arg('date_to') or today
+    return date_from, date_to
+
+@bp.route('/admin/reports')
+@login_required
+def admin_reports():
+    date_from, date_to = report_range()
+    end = date_to + timedelta(days=1)
+    period = request.args.get('period') if request.args.get('period') in ROLLUP_PERIODS else 'day'
+
+    # 🔹 Sab kuch rollup tables se, orders/order_items ko scan kiye bina
+    summary = sales_report('day', 'total', date_from, end)
+    breakdowns = {}
+    for dimension in ('product', 'category', 'table'):
+        labels = report_labels(dimension)
+        breakdowns[dimension] = [(labels.get(row.dim_key, f"#{row.dim_key}"), row)
+                                 for row in sales_report('day', dimension, date_from, end)]
+    timeline = sales_report(period, 'total', date_from, end, by_bucket=True)
+
+    return render_template('dashboard.html', summary=summary[0] if summary else None,
+                           breakdowns=breakdowns, timeline=timeline, period=period,
+                           periods=ROLLUP_PERIODS, period_labels=ROLLUP_PERIOD_LABELS, dimensions=ROLLUP_DIMENSIONS,
+                           date_from=date_from.strftime('%Y-%m-%d'), date_to=date_to.strftime('%Y-%m-%d'),
+                           turnaround=average_turnaround_minutes)
+
+@bp.route('/admin/reports/export.csv')
+@login_required
+def export_report():
+    date_from, date_to = report_range()
+    end = date_to + timedelta(days=1)
+    period = request.args.get('period') if request.args.get('period') in ROLLUP_PERIODS else 'day'
+    dimension = request.args.get('dimension') if request.args.get('dimension') in ROLLUP_DIMENSIONS else 'product'
+    rows = sales_report(period, dimension, date_from, end, by_bucket=True)
+    labels = report_labels(dimension)
+
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(['bucket', dimension + '_id', 'name', 'revenue', 'quantity', 'orders',
+                         'avg_turnaround_min'])
+        for row in rows:
+            minutes = average_turnaround_minutes(row)
+            writer.writerow([row.bucket.strftime('%Y-%m-%d %H:%M'), row.dim_key,
+                             labels.get(row.dim_key, f"#{row.dim_key}"), f"{row.revenue:.2f}", row.quantity,
+                             row.orders, f"{minutes:.1f}" if minutes is not None else ''])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+
+    filename = f"sales_{dimension}_{period}_{date_from:%Y%m%d}_{date_to:%Y%m%d}.csv"
+    return Response(generate(), mimetype='text/csv',
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+@bp.cli.command('rebuild-rollups')
+def rebuild_rollups_command():
+    """Recompute the sales rollups from existing completed orders."""
+    rebuild_rollups()
+    print("Sales rollups rebuilt.")
+
+# -------------------- Order Archive --------------------
+# Completed orders older than ARCHIVE_AFTER_DAYS move to archived_order and
+# archived_order_item, so the live tables and their indexes only hold
+# recent and open orders. Bills, the orders list and reports still read them.
+VACUUM_STEP_PAGES = 2000  # 8 MB with the default 4 KB pages
+
+def find_order(order_id):
+    """The live order, else the archived one; 404 if neither exists."""
+    return db.session.get(Order, order_id) or ArchivedOrder.query.get_or_404(order_id)
+
+def order_item_model(order):
+    return ArchivedOrderItem if isinstance(order, ArchivedOrder) else OrderItem
+
+def archive_orders(days, batch_size, pause=0.0):
+    """Move completed orders created more than `days` ago into the archive.
+
+    Each batch of batch_size orders is one short write transaction, with
+    `pause` seconds between batches so requests get the write lock in
+    between. Returns the number of orders moved.
+    """
+    cutoff = local_now() - timedelta(days=days)
+    # The newest order always stays: SQLite gives new rows MAX(id) + 1, and
+    # an id that is already in the archive must never be handed out again
+    newest_id = db.session.query(db.func.max(Order.id)).scalar() or 0
+    moved = 0
+    while True:
+        begin_write_transaction()
+        ids = [order_id for (order_id,) in
+               db.session.query(Order.id)
+               .filter(Order.status == 'completed', Order.created_at < cutoff, Order.id < newest_id)
+               .order_by(Order.id).limit(batch_size)]
+        if not ids:
+            db.session.rollback()
+            break
+        # Orders completed before reports existed are counted before they leave
+        rolled_up = {order_id for (order_id,) in
+                     db.session.query(RolledUpOrder.order_id).filter(RolledUpOrder.order_id.in_(ids))}
+        for order in Order.query.filter(Order.id.in_(set(ids) - rolled_up)):
+            record_order_rollup(order)
+
+        db.session.execute(ArchivedOrder.__table__.insert().from_select(
+            ['id', 'table_id', 'status', 'created_at', 'archived_at'],
+            db.select(Order.id, Order.table_id, Order.status, Order.created_at,
+                      db.literal(local_now(), db.DateTime)).where(Order.id.in_(ids))))
+        db.session.execute(ArchivedOrderItem.__table__.insert().from_select(
+            ['order_id', 'product_id', 'qty', 'price'],
+            db.select(OrderItem.order_id, OrderItem.product_id, OrderItem.qty, OrderItem.price)
+            .where(OrderItem.order_id.in_(ids)).order_by(OrderItem.id)))
+        OrderItem.query.filter(OrderItem.order_id.in_(ids)).delete(synchronize_session=False)
+        Order.query.filter(Order.id.in_(ids)).delete(synchronize_session=False)
+        # Archived orders can no longer change, so the ledger need not remember them
+        RolledUpOrder.query.filter(RolledUpOrder.order_id.in_(ids)).delete(synchronize_session=False)
         db.session.commit()
-        socketio.emit('order_status_updated', {'order_id': order.id, 'status': order.status}, broadcast=True)
+        moved += len(ids)
+        if pause:
+            time.sleep(pause)
+    return moved
+
+def enable_incremental_vacuum(conn):
+    # Switching auto_vacuum on an existing file takes one full VACUUM, which
+    # holds the write lock throughout; only done with no workers serving
+    if conn.exec_driver_sql('PRAGMA auto_vacuum').scalar() != 2:
+        conn.exec_driver_sql('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.exec_driver_sql('VACUUM')
+
+def compact_db(pause=0.0, full=False):
+    """Give free pages back to the filesystem; returns the bytes released, None if skipped.
+
+    Pages are released VACUUM_STEP_PAGES at a time, so the write lock is
+    only held briefly. That needs auto_vacuum=INCREMENTAL, set by migrate-db;
+    on a file without it nothing is done unless full is set, which runs the
+    one-time conversion first.
+    """
+    if db.engine.dialect.name != 'sqlite':
+        return 0
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        page_size = conn.exec_driver_sql('PRAGMA page_size').scalar()
+        freed = conn.exec_driver_sql('PRAGMA freelist_count').scalar()
+        if full:
+            enable_incremental_vacuum(conn)
+        elif conn.exec_driver_sql('PRAGMA auto_vacuum').scalar() != 2:
+            return None
+        while True:
+            free = conn.exec_driver_sql('PRAGMA freelist_count').scalar()
+            if not free:
+                break
+            # executescript runs the pragma to completion; execute() stops after one page
+            conn.connection.driver_connection.executescript(
+                f'PRAGMA incremental_vacuum({min(free, VACUUM_STEP_PAGES)});')
+            if pause:
+                time.sleep(pause)
+        conn.exec_driver_sql('PRAGMA wal_checkpoint(TRUNCATE)')
+        conn.exec_driver_sql('PRAGMA optimize')
+    return freed * page_size
+
+@bp.cli.command('archive-orders')
+@click.option('--days', type=int, help='Archive completed orders older than this; default ARCHIVE_AFTER_DAYS.')
+@click.option('--no-vacuum', is_flag=True, help='Skip compacting the database file afterwards.')
+@click.option('--full-vacuum', is_flag=True,
+              help='Switch a database that predates migrate-db to incremental vacuum; locks writers out '
+                   'for the whole VACUUM.')
+def archive_orders_command(days, no_vacuum, full_vacuum):
+    """Move old completed orders into the archive tables, then compact the database."""
+    config = current_app.config
+    days = config['ARCHIVE_AFTER_DAYS'] if days is None else days
+    moved = archive_orders(days, config['ARCHIVE_BATCH_SIZE'], config['ARCHIVE_BATCH_PAUSE'])
+    print(f"Archived {moved} orders completed before {days} days ago.")
+    if not no_vacuum:
+        freed = compact_db(config['ARCHIVE_BATCH_PAUSE'], full=full_vacuum)
+        if freed is None:
+            print("Skipped compaction: run migrate-db first, or pass --full-vacuum.")
+        else:
+            print(f"Compacted database, released {freed / 1e6:.1f} MB.")
+
+# -------------------- Migrations --------------------
+def migrate_db():
+    """Bring an existing database up to the current schema.
+
+    create_all() only creates missing tables, so indexes added to existing
+    tables and columns are created here. Duplicate order lines are merged first so the
+    unique (order_id, product_id) index can be built.
+    """
+    db.create_all()
+    # New nullable columns on existing tables
+    inspector = db.inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                ddl = CreateColumn(column).compile(dialect=db.engine.dialect)
+                db.session.execute(db.text(f'ALTER TABLE "{table.name}" ADD COLUMN {ddl}'))
+    duplicates = db.session.execute(db.text(
+        "SELECT order_id, product_id, MIN(id), SUM(qty), SUM(price) FROM order_item "
+        "GROUP BY order_id, product_id HAVING COUNT(*) > 1")).all()
+    for order_id, product_id, keep_id, qty, price in duplicates:
+        db.session.execute(db.text("UPDATE order_item SET qty = :qty, price = :price WHERE id = :id"),
+                           {'qty': qty, 'price': price, 'id': keep_id})
+        db.session.execute(db.text("DELETE FROM order_item WHERE order_id = :o AND product_id = :p AND id != :id"),
+                           {'o': order_id, 'p': product_id, 'id': keep_id})
+    db.session.commit()
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+    if db.engine.dialect.name == 'sqlite':
+        # Lets archive-orders release pages in small steps later (compact_db)
+        with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            enable_incremental_vacuum(conn)
+
+@bp.cli.command('build-image-variants')
+def build_image_variants_command():
+    """Build resized variants for images already in static/images and static/uploads."""
+    paths = {}
+    for folder in image_source_folders(current_app.config):
+        for name in sorted(os.listdir(folder)) if os.path.isdir(folder) else []:
+            if name.lower().endswith(product_images.IMAGE_EXTENSIONS):
+                paths.setdefault(name, os.path.join(folder, name))  # static/images wins
+
+    keys = {}
+    with ProcessPoolExecutor() as pool:
+        results = pool.map(product_images.build_file_variants, paths.values(),
+                           [image_variants_folder(current_app.config)] * len(paths))
+        for name, (_, key, error) in zip(paths, results):
+            if error:
+                print(f"Skipped {name}: {error}")
+            else:
+                keys[name] = key
+
+    updated = 0
+    for product in Product.query.filter(Product.image.isnot(None)).all():
+        if keys.get(product.image) and product.image_key != keys[product.image]:
+            product.image_key = keys[product.image]
+            updated += 1
+    db.session.commit()
+    catalog_cache.invalidate()
+    print(f"Built variants for {len(keys)} images, updated {updated} products.")
+
+def init_db():
+    """Migrate the schema and create the default owner account on first run."""
+    migrate_db()
+    if not User.query.first():
+        owner = User(username='owner')
+        owner.set_password('owner')
+        db.session.add(owner)
+        db.session.commit()
+
+@bp.cli.command('migrate-db')
+def migrate_db_command():
+    """Add missing indexes and constraints to an existing restaurant.db."""
+    migrate_db()
+    print("Database migrated.")
+
+@bp.cli.command('init-db')
+def init_db_command():
+    """migrate-db plus the default owner account; run once before the workers start."""
+    init_db()
+    print("Database ready.")
 
 # -------------------- Run App --------------------
+# Development server; production runs wsgi:app under gunicorn (gunicorn.conf.py)
 if __name__ == '__main__':
+    app = create_app()
     with app.app_context():
-        db.create_all()
-        if not User.query.first():
-            db.session.add(User(username='owner', password='owner'))
-            db.session.commit()
-        for t in Table.query.all():
-            qr_file = os.path.join(app.config['QRCODE_FOLDER'], f"table_{t.id}.png")
-            if not os.path.exists(qr_file):
-                generate_table_qr(t.id)
+        init_db()
 
     socketio.run(app, host='0.0.0.0', port=5000, debug=True)
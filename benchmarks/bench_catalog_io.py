@@ -0,0 +1,77 @@
+"""Bulk catalog import and streamed export vs. adding products one at a time.
+
+    python -m benchmarks.bench_catalog_io [products]
+
+Generates a CSV menu and loads it into a throwaway SQLite file three ways:
+import_catalog() into an empty menu, import_catalog() again (every row an
+update), and the per-row path of the add_product form (query the category,
+add, commit). Then times the streamed CSV and JSON export of the result.
+"""
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+TMP_DIR = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(TMP_DIR, 'bench.db')
+
+import catalog_io  # noqa: E402
+from app import create_app, db, import_catalog, catalog_export_rows, Category, Product  # noqa: E402
+
+app = create_app(instance_path=os.path.join(TMP_DIR, 'instance'))
+
+
+def menu_csv(products):
+    rng = random.Random(1)
+    lines = ['category,name,price,image']
+    lines += [f'Category {i % 25},Dish {i},{rng.randrange(40, 900, 10)},' for i in range(products)]
+    return '\n'.join(lines) + '\n'
+
+
+def timed(label, fn):
+    start = time.perf_counter()
+    result = fn()
+    print(f"{label:>24}: {(time.perf_counter() - start) * 1000:9.1f} ms")
+    return result
+
+
+def row_by_row(text):
+    for _, row in catalog_io.read_rows(io.StringIO(text), 'csv'):
+        values = catalog_io.clean_row(row, ())
+        category = Category.query.filter_by(name=values['category']).first()
+        if category is None:
+            category = Category(name=values['category'])
+            db.session.add(category)
+            db.session.commit()
+        db.session.add(Product(name=values['name'], price=values['price'], category_id=category.id))
+        db.session.commit()
+
+
+def export(fmt):
+    return sum(len(chunk) for chunk in catalog_io.write_rows(catalog_export_rows(), fmt))
+
+
+def main():
+    products = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    text = menu_csv(products)
+    print(f"{products} products, {len(text) / 1024:.0f} KiB of CSV\n")
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        report = timed('bulk import (insert)', lambda: import_catalog(catalog_io.read_rows(io.StringIO(text), 'csv')))
+        assert report.created == products, report.errors
+        report = timed('bulk import (update)', lambda: import_catalog(catalog_io.read_rows(io.StringIO(text), 'csv')))
+        assert report.updated == products, report.errors
+        size = timed('export csv', lambda: export('csv'))
+        timed('export json', lambda: export('json'))
+        print(f"{'':>24}  ({size / 1024:.0f} KiB of CSV)")
+
+        db.drop_all()
+        db.create_all()
+        timed('row by row', lambda: row_by_row(text))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Customer menu render time vs. menu size, with and without the fragment cache.
+
+    python -m benchmarks.bench_menu_render [iterations]
+
+For each menu size GET /menu/<table> is timed twice, with the whole menu on
+one page (MENU_PAGE_SIZE = menu size) and at the default page size, with
+MENU_FRAGMENT_CACHE off and on. The table has a few dishes in its cart, so
+the cached path also pays for filling in quantities.
+"""
+import os
+import sys
+import tempfile
+import time
+
+TMP_DIR = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(TMP_DIR, 'bench.db')
+
+from app import create_app, db, catalog_cache, Category, Product, Table  # noqa: E402
+
+app = create_app(instance_path=os.path.join(TMP_DIR, 'instance'))
+
+SIZES = (50, 150, 300, 600, 1000)
+DEFAULT_PAGE_SIZE = app.config['MENU_PAGE_SIZE']
+
+
+def seed(products):
+    db.drop_all()
+    db.create_all()
+    categories = [Category(name=f'Category {i}') for i in range(max(products // 15, 1))]
+    db.session.add_all(categories)
+    db.session.add(Table(name='T1'))
+    db.session.flush()
+    db.session.add_all(Product(name=f'Dish {i}', price=float(50 + i % 40 * 10),
+                               category_id=categories[i % len(categories)].id,
+                               image=f'dish{i}.jpg' if i % 2 else None,
+                               image_key='0123456789abcdef' if i % 4 == 1 else None)
+                       for i in range(products))
+    db.session.commit()
+    catalog_cache.invalidate()
+
+
+def median_ms(client, iterations):
+    client.get('/menu/1')  # warm-up: template compile, catalog snapshot, first fragments
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        client.get('/menu/1')
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return samples[len(samples) // 2] * 1000
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    client = app.test_client()
+    print(f"{'products':>8} {'page':>5} {'uncached ms':>12} {'cached ms':>10} {'speedup':>8}")
+    for size in SIZES:
+        with app.app_context():
+            seed(size)
+        for cart_pid in (1, 2, 3):
+            client.post('/api/cart/1/items', json={'product_id': cart_pid, 'delta': 1})
+        for page_size in (size, DEFAULT_PAGE_SIZE):
+            app.config['MENU_PAGE_SIZE'] = page_size
+            app.config['MENU_FRAGMENT_CACHE'] = False
+            uncached = median_ms(client, iterations)
+            app.config['MENU_FRAGMENT_CACHE'] = True
+            cached = median_ms(client, iterations)
+            print(f"{size:8d} {page_size:5d} {uncached:12.2f} {cached:10.2f} {uncached / cached:7.1f}x")
+    app.config['MENU_PAGE_SIZE'] = DEFAULT_PAGE_SIZE
+
+
+if __name__ == '__main__':
+    main()
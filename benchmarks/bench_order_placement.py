@@ -0,0 +1,83 @@
+"""Orders/second for place_order() vs. the old per-line placement path.
+
+Runs against a throwaway SQLite file, never restaurant.db:
+
+    python -m benchmarks.bench_order_placement [orders] [lines_per_order]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+TMP_DIR = tempfile.mkdtemp()
+DB_PATH = os.path.join(TMP_DIR, 'bench.db')
+os.environ['DATABASE_URL'] = 'sqlite:///' + DB_PATH
+
+from app import create_app, db, Category, Product, Table, Order, OrderItem, place_order  # noqa: E402
+
+app = create_app(instance_path=os.path.join(TMP_DIR, 'instance'))
+
+
+def seed(tables=20, products=200):
+    db.drop_all()
+    db.create_all()
+    category = Category(name='Bench')
+    db.session.add(category)
+    db.session.flush()
+    db.session.add_all(Table(name=f'T{i}') for i in range(tables))
+    db.session.add_all(Product(name=f'Item {i}', price=50 + i % 40, category_id=category.id)
+                       for i in range(products))
+    db.session.commit()
+
+
+def legacy_place_order(table_id, cart):
+    # The cart() branch as it was: commit the order, then one lookup per line.
+    order = Order.query.filter_by(table_id=table_id).filter(Order.status.in_(['pending', 'preparing'])).first()
+    if not order:
+        order = Order(table_id=table_id)
+        db.session.add(order)
+        db.session.commit()
+    for pid, qty in cart.items():
+        product = Product.query.get(int(pid))
+        existing = OrderItem.query.filter_by(order_id=order.id, product_id=product.id).first()
+        if existing:
+            existing.qty = (existing.qty or 0) + qty
+            existing.price = existing.qty * product.price
+        else:
+            db.session.add(OrderItem(order_id=order.id, product_id=product.id,
+                                     qty=qty, price=product.price * qty))
+    db.session.commit()
+    return order
+
+
+def run(fn, carts, tables):
+    start = time.perf_counter()
+    for i, cart in enumerate(carts):
+        order = fn(1 + i % tables, cart)
+        if i % 5 == 4:
+            # Close some orders so both paths exercise insert and upsert
+            order.status = 'completed'
+            db.session.commit()
+    return len(carts) / (time.perf_counter() - start)
+
+
+def main():
+    orders = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    lines = int(sys.argv[2]) if len(sys.argv) > 2 else 6
+    tables, products = 20, 200
+    rng = random.Random(42)
+    carts = [{str(pid): rng.randint(1, 3) for pid in rng.sample(range(1, products + 1), lines)}
+             for _ in range(orders)]
+
+    with app.app_context():
+        results = {}
+        for name, fn in [('legacy', legacy_place_order), ('place_order', place_order)]:
+            seed(tables, products)
+            results[name] = run(fn, carts, tables)
+            print(f"{name:12s} {results[name]:8.1f} orders/s")
+        print(f"speedup      {results['place_order'] / results['legacy']:8.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,249 @@
+"""End-to-end latency of the customer ordering flow, reported as JSON.
+
+    python -m benchmarks.bench_ordering_flow [--requests N] [--orders N]
+                                             [--output run.json] [--baseline old.json]
+
+Seeds a throwaway SQLite file with a restaurant's worth of data (tables,
+categories, products and months of historical orders) and drives the real
+app through the Flask test client and a SocketIO test client:
+
+  menu_browse     GET /menu/<table>
+  cart_tap        POST /menu/<table> increase/decrease
+  order_place     POST place_order from menu() and cart(), alternating
+  admin_orders    GET /admin/orders: first page, status filter, date range
+  status_update   update_order_status over SocketIO (kitchen login)
+
+Every scenario reports p50/p99/mean latency in ms, requests/second and SQL
+statements per request. Requests/second covers the timed part only, so for
+this single client it is 1000 / mean_ms. The random seed is fixed, so two
+runs of the same tree issue the same requests; --baseline prints the change
+against an earlier run's JSON on stderr.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+TMP_DIR = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(TMP_DIR, 'bench.db')
+
+from sqlalchemy import event  # noqa: E402
+
+from app import (create_app, db, socketio, User, Category, Product, Table, Order, OrderItem,  # noqa: E402
+                 local_now, status_batcher)
+
+app = create_app(instance_path=os.path.join(TMP_DIR, 'instance'))
+
+WARMUP = 20
+SEED_BATCH = 5000
+
+
+def seed(rng, tables, products, orders, open_orders):
+    db.drop_all()
+    db.create_all()
+    user = User(username='bench')
+    user.set_password('bench')
+    db.session.add(user)
+    categories = [Category(name=f'Category {i}') for i in range(max(products // 30, 1))]
+    db.session.add_all(categories)
+    db.session.flush()
+    db.session.add_all(Table(name=f'T{i + 1}') for i in range(tables))
+    db.session.add_all(Product(name=f'Dish {i}', price=float(rng.randrange(60, 600, 10)),
+                               category_id=categories[i % len(categories)].id)
+                       for i in range(products))
+    db.session.commit()
+    prices = dict(db.session.query(Product.id, Product.price))
+    product_ids = list(prices)
+
+    # History spread over 90 days; the newest open_orders are still in the kitchen
+    now = local_now()
+    order_rows, item_rows = [], []
+    for order_id in range(1, orders + 1):
+        age = (orders - order_id) / orders * timedelta(days=90)
+        status = rng.choice(['pending', 'preparing']) if order_id > orders - open_orders else 'completed'
+        order_rows.append({'id': order_id, 'table_id': rng.randint(1, tables), 'status': status,
+                           'created_at': now - age})
+        for pid in rng.sample(product_ids, rng.randint(1, 5)):
+            qty = rng.randint(1, 3)
+            item_rows.append({'order_id': order_id, 'product_id': pid, 'qty': qty, 'price': prices[pid] * qty})
+    for table, rows in ((Order.__table__, order_rows), (OrderItem.__table__, item_rows)):
+        for start in range(0, len(rows), SEED_BATCH):
+            db.session.execute(table.insert(), rows[start:start + SEED_BATCH])
+    db.session.commit()
+    return product_ids, len(item_rows)
+
+
+class QueryCounter:
+    """Counts every statement the engine runs, HTTP and SocketIO alike."""
+
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, 'after_cursor_execute', self._executed)
+
+    def _executed(self, *args):
+        self.count += 1
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def measure(name, requests, step, queries, prepare=None):
+    for i in range(WARMUP):
+        if prepare:
+            prepare(i)
+        step(i)
+    timings, errors = [], 0
+    queries_before = queries.count
+    for i in range(requests):
+        if prepare:
+            prepare(WARMUP + i)
+        t0 = time.perf_counter()
+        ok = step(WARMUP + i)
+        timings.append(time.perf_counter() - t0)
+        errors += not ok
+    result = {
+        'requests': requests,
+        'errors': errors,
+        'p50_ms': round(percentile(timings, 0.50) * 1000, 3),
+        'p99_ms': round(percentile(timings, 0.99) * 1000, 3),
+        'mean_ms': round(sum(timings) / requests * 1000, 3),
+        'rps': round(requests / sum(timings), 1),
+        'queries_per_request': round((queries.count - queries_before) / requests, 2),
+    }
+    print(f"{name:>14}: p50 {result['p50_ms']:8.2f} ms  p99 {result['p99_ms']:8.2f} ms  "
+          f"{result['rps']:8.1f} req/s  {result['queries_per_request']:6.2f} queries", file=sys.stderr)
+    return result
+
+
+def scenarios(rng, tables, product_ids, open_order_ids):
+    customer = app.test_client()
+    staff = app.test_client()
+    staff.post('/admin/login', data={'username': 'bench', 'password': 'bench'})
+    kitchen = socketio.test_client(app, flask_test_client=staff, auth={'kitchen': True})
+    today = local_now().date()
+
+    def menu_browse(i):
+        return customer.get(f'/menu/{rng.randint(1, tables)}').status_code == 200
+
+    def cart_tap(i):
+        action = 'decrease' if i % 3 == 2 else 'increase'
+        response = customer.post(f'/menu/{rng.randint(1, tables)}',
+                                 data={'action': action, 'product_id': rng.choice(product_ids)})
+        return response.status_code == 200
+
+    placing = {}
+
+    def fill_cart(i):
+        # Filling the cart is cart_tap's job; only the placement itself is timed
+        placing['table_id'] = table_id = rng.randint(1, tables)
+        for pid in rng.sample(product_ids, 3):
+            app.extensions['carts'].incr(str(table_id), pid, rng.randint(1, 2))
+
+    def order_place(i):
+        page = 'menu' if i % 2 else 'cart'
+        response = customer.post(f"/{page}/{placing['table_id']}", data={'action': 'place_order'})
+        return response.status_code == 302
+
+    admin_urls = ['/admin/orders', '/admin/orders?status=completed', '/admin/orders?status=pending',
+                  f'/admin/orders?date_from={today - timedelta(days=30)}&date_to={today - timedelta(days=23)}']
+
+    def admin_orders(i):
+        return staff.get(admin_urls[i % len(admin_urls)]).status_code == 200
+
+    # Each open order walks pending -> preparing -> served -> completed
+    next_status = {'pending': 'preparing', 'preparing': 'served', 'served': 'completed'}
+    statuses = {order_id: 'pending' for order_id in open_order_ids}
+    queue = list(open_order_ids)
+
+    def status_update(i):
+        order_id = queue[i % len(queue)]
+        status = next_status.get(statuses[order_id], 'pending')
+        statuses[order_id] = status
+        kitchen.emit('update_order_status', {'order_id': order_id, 'status': status})
+        kitchen.get_received()
+        return True
+
+    # name -> (untimed setup, timed step)
+    return {
+        'menu_browse': (None, menu_browse),
+        'cart_tap': (None, cart_tap),
+        'order_place': (fill_cart, order_place),
+        'admin_orders': (None, admin_orders),
+        'status_update': (None, status_update),
+    }
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)['scenarios']
+    print(f"\n{'scenario':>14} {'p50':>10} {'p99':>10} {'rps':>10} {'queries':>10}", file=sys.stderr)
+    for name, result in results.items():
+        old = baseline.get(name)
+        if not old:
+            continue
+        changes = [(result[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+                   for key in ('p50_ms', 'p99_ms', 'rps', 'queries_per_request')]
+        print(f"{name:>14} " + ' '.join(f"{change:+9.1f}%" for change in changes), file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--requests', type=int, default=500, help='measured requests per scenario')
+    parser.add_argument('--tables', type=int, default=40)
+    parser.add_argument('--products', type=int, default=400)
+    parser.add_argument('--orders', type=int, default=30000, help='historical orders to seed')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='also write the JSON report to this file')
+    parser.add_argument('--baseline', help='JSON report of an earlier run to compare against')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    # Enough open orders that every one is updated at most a few times
+    open_orders = max(args.requests // 2, 50)
+    with app.app_context():
+        started = time.perf_counter()
+        product_ids, items = seed(rng, args.tables, args.products, args.orders, open_orders)
+        print(f"Seeded {args.orders} orders / {items} items in {time.perf_counter() - started:.1f}s",
+              file=sys.stderr)
+        open_order_ids = [order_id for (order_id,) in
+                          db.session.query(Order.id).filter(Order.status != 'completed').order_by(Order.id)]
+        queries = QueryCounter(db.engine)
+
+    results = {}
+    for name, (prepare, step) in scenarios(rng, args.tables, product_ids, open_order_ids).items():
+        results[name] = measure(name, args.requests, step, queries, prepare)
+    status_batcher.flush()
+
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'cart_store': app.config['CART_STORE'],
+            'seed': args.seed,
+            'tables': args.tables,
+            'products': args.products,
+            'orders': args.orders,
+            'order_items': items,
+            'requests_per_scenario': args.requests,
+        },
+        'scenarios': results,
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == '__main__':
+    main()
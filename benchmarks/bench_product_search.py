@@ -0,0 +1,100 @@
+"""Menu search latency: the in-memory index vs. SQL LIKE, and the JSON endpoint.
+
+    python -m benchmarks.bench_product_search [products] [iterations]
+
+Seeds a throwaway SQLite file with a menu of generated dish names and times
+each query shape (word, prefix, two words, category and price filters,
+no query at all) three ways: SearchIndex.search() on the catalog snapshot,
+the LIKE + COUNT + LIMIT queries a SQL implementation would run, and a full
+GET /api/menu/search through the test client.
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+TMP_DIR = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(TMP_DIR, 'bench.db')
+
+from app import create_app, db, catalog_cache, Category, Product  # noqa: E402
+
+app = create_app(instance_path=os.path.join(TMP_DIR, 'instance'))
+MENU_PAGE_SIZE = app.config['MENU_PAGE_SIZE']
+
+WORDS = ('paneer tikka masala butter chicken dal makhani naan roti garlic jeera rice biryani veg mutton '
+         'fish curry kadai palak aloo gobi chole bhature lassi mango sweet chai coffee cold ice cream '
+         'gulab jamun soup tomato noodles fried spring roll chilli tandoori malai kofta').split()
+
+QUERIES = [
+    ('word', {'q': 'paneer'}),
+    ('prefix', {'q': 'ch'}),
+    ('two words', {'q': 'butter chicken'}),
+    ('no match', {'q': 'pizza'}),
+    ('category', {'q': 'masala', 'category_id': 3}),
+    ('price range', {'q': 'dal', 'min_price': 100, 'max_price': 300}),
+    ('no query', {}),
+]
+
+
+def seed(products):
+    rng = random.Random(1)
+    db.drop_all()
+    db.create_all()
+    categories = [Category(name=f'Category {i}') for i in range(20)]
+    db.session.add_all(categories)
+    db.session.flush()
+    db.session.add_all(Product(name=' '.join(rng.sample(WORDS, 3)).title(), price=float(rng.randrange(40, 900, 10)),
+                               category_id=categories[i % len(categories)].id)
+                       for i in range(products))
+    db.session.commit()
+
+
+def sql_search(q=None, category_id=None, min_price=None, max_price=None):
+    query = Product.query
+    for word in (q or '').split():
+        query = query.filter(Product.name.ilike(f'%{word}%'))
+    if category_id:
+        query = query.filter(Product.category_id == category_id)
+    if min_price is not None:
+        query = query.filter(Product.price >= min_price, Product.price < max_price)
+    return query.count(), query.order_by(Product.id).limit(MENU_PAGE_SIZE).all()
+
+
+def timings_us(fn, iterations):
+    fn()  # warm-up
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    return samples[len(samples) // 2], samples[min(int(len(samples) * 0.99), len(samples) - 1)]
+
+
+def main():
+    products = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    client = app.test_client()
+    with app.app_context():
+        seed(products)
+        catalog = catalog_cache.get()
+        start = time.perf_counter()
+        index = catalog.search_index
+        print(f"{products} products, index built in {(time.perf_counter() - start) * 1000:.1f} ms\n")
+
+        print(f"{'query':>12} {'hits':>5} {'index p50/p99 us':>18} {'SQL LIKE p50/p99 us':>21} "
+              f"{'endpoint p50/p99 us':>21}")
+        for name, args in QUERIES:
+            hits = index.search(args.get('q'), args.get('category_id'), args.get('min_price'),
+                                args.get('max_price'), per_page=MENU_PAGE_SIZE).total
+            index_us = timings_us(lambda: index.search(args.get('q'), args.get('category_id'), args.get('min_price'),
+                                                       args.get('max_price'), per_page=MENU_PAGE_SIZE), iterations)
+            sql_us = timings_us(lambda: sql_search(**args), iterations)
+            endpoint_us = timings_us(lambda: client.get('/api/menu/search', query_string=args), iterations // 5)
+            print(f"{name:>12} {hits:5d} {index_us[0]:8.1f} /{index_us[1]:8.1f} {sql_us[0]:10.1f} /{sql_us[1]:9.1f} "
+                  f"{endpoint_us[0]:10.1f} /{endpoint_us[1]:9.1f}")
+
+
+if __name__ == '__main__':
+    main()
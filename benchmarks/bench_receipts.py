@@ -0,0 +1,69 @@
+"""Receipts/second for the native receipt renderer vs. bill.html + pdfkit.
+
+    python -m benchmarks.bench_receipts [iterations] [items]
+
+The pdfkit row is skipped when wkhtmltopdf is not installed.
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+TMP_DIR = tempfile.mkdtemp()
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(TMP_DIR, 'bench.db'))
+
+import pdfkit  # noqa: E402
+import receipt  # noqa: E402
+from app import create_app, get_pdfkit_config  # noqa: E402
+
+app = create_app(instance_path=os.path.join(TMP_DIR, 'instance'))
+from flask import render_template  # noqa: E402
+
+
+def sample_bill(items):
+    lines = [SimpleNamespace(product=SimpleNamespace(name=f'Paneer Tikka Masala {i}'), qty=1 + i % 3,
+                             price=180.0 * (1 + i % 3)) for i in range(items)]
+    order = SimpleNamespace(id=1234, table=SimpleNamespace(name='Table 7'), created_at=datetime(2024, 5, 1, 13, 30))
+    return order, lines
+
+
+def rate(fn, iterations):
+    fn()  # warm-up (font loading, first subprocess)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return iterations / (time.perf_counter() - start)
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    items = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    width_mm = app.config['BILL_WIDTH_MM']
+    order, lines = sample_bill(items)
+    native = receipt.Receipt(order.id, order.table.name, order.created_at,
+                             [receipt.ReceiptItem(i.product.name, i.qty, i.price) for i in lines],
+                             sum(i.price for i in lines))
+
+    for fmt in receipt.RECEIPT_FORMATS:
+        print(f"native {fmt:8s} {rate(lambda: receipt.render(native, fmt, width_mm), iterations):9.1f} receipts/s")
+
+    try:
+        pdf_config = get_pdfkit_config()
+    except OSError:
+        print("pdfkit          skipped (wkhtmltopdf not found)")
+        return
+
+    def render_pdfkit():
+        with app.test_request_context():
+            html = render_template('bill.html', order=order, order_items=lines,
+                                   total_price=sum(i.price for i in lines))
+        pdfkit.from_string(html, False, options={"enable-local-file-access": "", "quiet": ""},
+                           configuration=pdf_config)
+
+    print(f"pdfkit          {rate(render_pdfkit, max(iterations // 20, 5)):9.1f} receipts/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""Server-side emit latency vs. connected clients: global broadcast vs. rooms.
+
+    python -m benchmarks.bench_socket_fanout [emits]
+
+Clients are Flask-SocketIO test clients spread over 40 tables plus a few
+staff screens, so the numbers cover the server's fan-out work (room lookup,
+packet encoding, per-client queueing), not the network.
+"""
+import os
+import sys
+import tempfile
+import time
+
+TMP_DIR = tempfile.mkdtemp()
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(TMP_DIR, 'bench.db'))
+
+from app import create_app, db, socketio, User, KITCHEN_ROOM, ADMIN_ROOM, table_room  # noqa: E402
+
+app = create_app(instance_path=os.path.join(TMP_DIR, 'instance'))
+
+TABLES = 40
+STAFF = 4
+
+
+def connect_clients(count, staff_http):
+    clients = [socketio.test_client(app, flask_test_client=staff_http, auth={'kitchen': True})
+               for _ in range(STAFF)]
+    clients += [socketio.test_client(app, auth={'table_id': 1 + i % TABLES}) for i in range(count - STAFF)]
+    return clients
+
+
+def time_emits(emits, rooms, clients):
+    payload = {'changes': [{'order_id': 1, 'table_id': 7, 'status': 'preparing'}]}
+    start = time.perf_counter()
+    for _ in range(emits):
+        socketio.emit('order_status_batch', payload, to=rooms)
+    elapsed = time.perf_counter() - start
+    delivered = sum(len(c.get_received()) for c in clients)
+    return elapsed / emits * 1e6, delivered / emits
+
+
+def main():
+    emits = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    with app.app_context():
+        db.create_all()
+        if not User.query.filter_by(username='bench').first():
+            user = User(username='bench')
+            user.set_password('bench')
+            db.session.add(user)
+            db.session.commit()
+    staff_http = app.test_client()
+    staff_http.post('/admin/login', data={'username': 'bench', 'password': 'bench'})
+
+    print(f"{'clients':>8} {'broadcast us':>13} {'recv/emit':>10} {'rooms us':>10} {'recv/emit':>10}")
+    for count in (10, 50, 200, 1000):
+        clients = connect_clients(count, staff_http)
+        for c in clients:
+            c.get_received()
+        broadcast_us, broadcast_recv = time_emits(emits, None, clients)
+        rooms_us, rooms_recv = time_emits(emits, [KITCHEN_ROOM, ADMIN_ROOM, table_room(7)], clients)
+        print(f"{count:8d} {broadcast_us:13.1f} {broadcast_recv:10.1f} {rooms_us:10.1f} {rooms_recv:10.1f}")
+        for c in clients:
+            c.disconnect()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""Throughput of the gunicorn/eventlet deployment as workers are added.
+
+    python -m benchmarks.bench_workers [seconds] [worker counts...]
+
+Starts `gunicorn -c gunicorn.conf.py wsgi:app` against a throwaway database
+for each worker count and drives it over HTTP from several client processes
+with a customer mix: menu page, cart changes and the JSON menu. With more
+than one worker the carts and SocketIO emits go through the SQLite stores,
+exactly as in production. Scaling needs spare cores for the workers.
+"""
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TMP_DIR = tempfile.mkdtemp()
+PORT = 5099
+TABLES = 20
+PRODUCTS = 60
+CLIENT_PROCESSES = 4
+THREADS_PER_PROCESS = 8
+
+ENV = dict(os.environ,
+           DATABASE_URL='sqlite:///' + os.path.join(TMP_DIR, 'bench.db'),
+           INSTANCE_PATH=os.path.join(TMP_DIR, 'instance'),
+           CART_DB_PATH=os.path.join(TMP_DIR, 'carts.db'),
+           SOCKETIO_MESSAGE_QUEUE='sqlite:///' + os.path.join(TMP_DIR, 'socketio-queue.db'),
+           BIND=f'127.0.0.1:{PORT}')
+
+
+def seed():
+    os.environ.update(ENV)
+    sys.path.insert(0, ROOT)
+    from app import create_app, init_db, db, Category, Product, Table
+    app = create_app()
+    with app.app_context():
+        init_db()
+        categories = [Category(name=f"Category {i}") for i in range(6)]
+        db.session.add_all(categories)
+        db.session.flush()
+        db.session.add_all(Product(name=f"Dish {i}", price=50 + i, category_id=categories[i % 6].id)
+                           for i in range(PRODUCTS))
+        db.session.add_all(Table(name=f"T{i + 1}") for i in range(TABLES))
+        db.session.commit()
+        db.engine.dispose()
+
+
+def wait_for_port(timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', PORT), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("gunicorn did not start")
+
+
+def client_loop(seconds, seed_value):
+    rnd = random.Random(seed_value)
+    conn = http.client.HTTPConnection('127.0.0.1', PORT, timeout=10)
+    done = errors = 0
+    end = time.time() + seconds
+    while time.time() < end:
+        table = rnd.randint(1, TABLES)
+        pick = rnd.random()
+        try:
+            if pick < 0.4:
+                conn.request('GET', f'/menu/{table}')
+            elif pick < 0.8:
+                body = json.dumps({'product_id': rnd.randint(1, PRODUCTS), 'delta': 1})
+                conn.request('POST', f'/api/cart/{table}/items', body, {'Content-Type': 'application/json'})
+            else:
+                conn.request('GET', '/api/menu')
+            response = conn.getresponse()
+            response.read()
+            if response.status < 400:
+                done += 1
+            else:
+                errors += 1
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection('127.0.0.1', PORT, timeout=10)
+    return done, errors
+
+
+def client_process(args):
+    seconds, index = args
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(THREADS_PER_PROCESS) as pool:
+        results = list(pool.map(client_loop, [seconds] * THREADS_PER_PROCESS,
+                                range(index * 100, index * 100 + THREADS_PER_PROCESS)))
+    return sum(r[0] for r in results), sum(r[1] for r in results)
+
+
+def run(workers, seconds):
+    env = dict(ENV, WEB_CONCURRENCY=str(workers))
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app'],
+                              cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port()
+        client_process((1, 0))  # warm up every worker's caches
+        with multiprocessing.Pool(CLIENT_PROCESSES) as pool:
+            results = pool.map(client_process, [(seconds, i) for i in range(CLIENT_PROCESSES)])
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=30)
+    done = sum(r[0] for r in results)
+    errors = sum(r[1] for r in results)
+    return done / seconds, errors
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    counts = [int(a) for a in sys.argv[2:]] or [1, 2, 4]
+    seed()
+    print(f"{os.cpu_count()} CPUs, {CLIENT_PROCESSES * THREADS_PER_PROCESS} concurrent clients, {seconds:g}s per run")
+    print(f"{'workers':>8} {'req/s':>10} {'errors':>8}")
+    for workers in counts:
+        rps, errors = run(workers, seconds)
+        print(f"{workers:8d} {rps:10.1f} {errors:8d}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+"""Server-side cart storage.
+
+A cart is a {product_id: qty} dict stored under a string key (the table,
+or table plus device when carts are not shared). Both backends make every
+quantity change a single atomic operation and drop carts that have not
+been touched for ttl seconds.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+EVICT_INTERVAL = 60  # seconds between opportunistic sweeps of expired carts
+
+
+class CartStore:
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._next_evict = 0
+
+    def _maybe_evict(self):
+        now = time.time()
+        if now >= self._next_evict:
+            self._next_evict = now + EVICT_INTERVAL
+            self.evict_expired(now)
+
+    def get(self, key):
+        """Return a copy of the cart as {product_id: qty}."""
+        raise NotImplementedError
+
+    def incr(self, key, product_id, delta, min_qty=0):
+        """Add delta to one line and return the new quantity.
+
+        The line is removed when it drops to zero, never goes below min_qty
+        once it exists, and a negative delta never creates a line.
+        """
+        raise NotImplementedError
+
+    def remove(self, key, product_id):
+        raise NotImplementedError
+
+    def take(self, key):
+        """Atomically return the cart and empty it (used to place an order)."""
+        raise NotImplementedError
+
+    def evict_expired(self, now=None):
+        raise NotImplementedError
+
+
+class MemoryCartStore(CartStore):
+    """Carts in a process-local dict; fastest, but one worker only."""
+
+    def __init__(self, ttl):
+        super().__init__(ttl)
+        self._lock = threading.Lock()
+        self._carts = {}  # key -> [lines, last_touched]
+
+    def _cart(self, key, now):
+        entry = self._carts.get(key)
+        if entry is None or entry[1] + self.ttl < now:
+            entry = self._carts[key] = [{}, now]
+        entry[1] = now
+        return entry[0]
+
+    def get(self, key):
+        self._maybe_evict()
+        with self._lock:
+            entry = self._carts.get(key)
+            if entry is None or entry[1] + self.ttl < time.time():
+                return {}
+            return dict(entry[0])
+
+    def incr(self, key, product_id, delta, min_qty=0):
+        self._maybe_evict()
+        with self._lock:
+            lines = self._cart(key, time.time())
+            current = lines.get(product_id, 0)
+            if not current and delta < 0:
+                return 0
+            qty = max(current + delta, min_qty)
+            if qty > 0:
+                lines[product_id] = qty
+            else:
+                lines.pop(product_id, None)
+            return qty
+
+    def remove(self, key, product_id):
+        with self._lock:
+            self._cart(key, time.time()).pop(product_id, None)
+
+    def take(self, key):
+        with self._lock:
+            entry = self._carts.pop(key, None)
+        if entry is None or entry[1] + self.ttl < time.time():
+            return {}
+        return entry[0]
+
+    def evict_expired(self, now=None):
+        cutoff = (now or time.time()) - self.ttl
+        with self._lock:
+            for key in [k for k, entry in self._carts.items() if entry[1] < cutoff]:
+                del self._carts[key]
+
+
+class SQLiteCartStore(CartStore):
+    """Carts in a SQLite file, shared by every worker on the machine."""
+
+    def __init__(self, ttl, path):
+        super().__init__(ttl)
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""CREATE TABLE IF NOT EXISTS cart_item (
+                            cart_key TEXT NOT NULL,
+                            product_id INTEGER NOT NULL,
+                            qty INTEGER NOT NULL,
+                            updated_at REAL NOT NULL,
+                            PRIMARY KEY (cart_key, product_id))""")
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_cart_item_updated_at ON cart_item (updated_at)")
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Autocommit mode; writes take the lock up front with BEGIN IMMEDIATE
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            self._local.conn = conn
+        return conn
+
+    def _live(self, conn, key):
+        # A cart expires as a whole, measured from its most recent change
+        row = conn.execute("SELECT MAX(updated_at) FROM cart_item WHERE cart_key = ?", (key,)).fetchone()
+        return row[0] is not None and row[0] + self.ttl >= time.time()
+
+    def get(self, key):
+        self._maybe_evict()
+        conn = self._conn()
+        if not self._live(conn, key):
+            return {}
+        return dict(conn.execute("SELECT product_id, qty FROM cart_item WHERE cart_key = ?", (key,)))
+
+    def incr(self, key, product_id, delta, min_qty=0):
+        self._maybe_evict()
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if not self._live(conn, key):
+                conn.execute("DELETE FROM cart_item WHERE cart_key = ?", (key,))
+            if delta > 0:
+                conn.execute("""INSERT INTO cart_item (cart_key, product_id, qty, updated_at)
+                                VALUES (?, ?, MAX(?, ?), ?)
+                                ON CONFLICT (cart_key, product_id)
+                                DO UPDATE SET qty = MAX(qty + ?, ?), updated_at = excluded.updated_at""",
+                             (key, product_id, delta, min_qty, now, delta, min_qty))
+            else:
+                conn.execute("""UPDATE cart_item SET qty = MAX(qty + ?, ?), updated_at = ?
+                                WHERE cart_key = ? AND product_id = ?""",
+                             (delta, min_qty, now, key, product_id))
+                conn.execute("DELETE FROM cart_item WHERE cart_key = ? AND product_id = ? AND qty <= 0",
+                             (key, product_id))
+            row = conn.execute("SELECT qty FROM cart_item WHERE cart_key = ? AND product_id = ?",
+                               (key, product_id)).fetchone()
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return row[0] if row else 0
+
+    def remove(self, key, product_id):
+        self._conn().execute("DELETE FROM cart_item WHERE cart_key = ? AND product_id = ?", (key, product_id))
+
+    def take(self, key):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cart = (dict(conn.execute("SELECT product_id, qty FROM cart_item WHERE cart_key = ?", (key,)))
+                    if self._live(conn, key) else {})
+            conn.execute("DELETE FROM cart_item WHERE cart_key = ?", (key,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return cart
+
+    def evict_expired(self, now=None):
+        cutoff = (now or time.time()) - self.ttl
+        self._conn().execute("""DELETE FROM cart_item WHERE cart_key IN (
+                                    SELECT cart_key FROM cart_item
+                                    GROUP BY cart_key HAVING MAX(updated_at) < ?)""", (cutoff,))
+
+
+def create_cart_store(backend, ttl, path=None):
+    if backend == 'sqlite':
+        return SQLiteCartStore(ttl, path)
+    if backend == 'memory':
+        return MemoryCartStore(ttl)
+    raise ValueError(f"Unknown cart store backend: {backend}")
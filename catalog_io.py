@@ -0,0 +1,127 @@
+"""Reading and writing the menu catalog as CSV or JSON, one row at a time.
+
+A row is {'category', 'name', 'price', 'image'}; products are matched by
+category and name, so files move between branches whose ids differ. Both
+directions are generators and never hold the whole file.
+"""
+import csv
+import io
+import json
+import math
+import os
+import unicodedata
+
+FIELDS = ('category', 'name', 'price', 'image')
+FORMATS = ('csv', 'json')
+NAME_MAX_LENGTH = 100  # Category.name / Product.name column sizes
+READ_CHUNK = 64 * 1024
+MAX_OBJECT_SIZE = 1024 * 1024  # characters of one JSON record; anything longer is a syntax error
+
+
+class RowError(ValueError):
+    pass
+
+
+def detect_format(filename):
+    ext = os.path.splitext(filename or '')[1].lower()
+    return 'json' if ext in ('.json', '.jsonl', '.ndjson') else 'csv'
+
+
+def iter_json_objects(stream):
+    """Objects from a JSON array or from JSON Lines, decoded as they arrive."""
+    decoder = json.JSONDecoder()
+    buffer, pos, eof = '', 0, False
+    while True:
+        # Skip what separates objects: whitespace, the array brackets and commas
+        while pos < len(buffer) and buffer[pos] in ' \t\r\n,[]':
+            pos += 1
+        if pos == len(buffer):
+            if eof:
+                return
+            buffer, pos = stream.read(READ_CHUNK), 0
+            eof = not buffer
+            continue
+        try:
+            obj, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError as e:
+            if eof:
+                raise
+            if len(buffer) - pos > MAX_OBJECT_SIZE:
+                # Otherwise one early syntax error would read the rest of the file into memory
+                raise RowError(f"no complete JSON object in {MAX_OBJECT_SIZE} characters: {e}") from None
+            chunk = stream.read(READ_CHUNK)
+            eof = not chunk
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+        yield obj
+        pos = end
+
+
+def read_rows(stream, fmt):
+    """Yield (line or record number, raw row) from a text stream."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        missing = [field for field in ('category', 'name', 'price') if field not in (reader.fieldnames or ())]
+        if missing:
+            raise RowError(f"CSV header is missing: {', '.join(missing)}")
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for number, obj in enumerate(iter_json_objects(stream), 1):
+            yield number, obj
+
+
+def clean_row(row, image_extensions):
+    """Validated {'category', 'name', 'price', 'image'}; raises RowError."""
+    if not isinstance(row, dict):
+        raise RowError("expected an object with category, name and price")
+    values = {}
+    for field in ('category', 'name'):
+        value = str(row.get(field) or '').strip()
+        if not value:
+            raise RowError(f"{field} is required")
+        if len(value) > NAME_MAX_LENGTH:
+            raise RowError(f"{field} is longer than {NAME_MAX_LENGTH} characters")
+        if any(unicodedata.category(ch) == 'Cc' for ch in value):
+            raise RowError(f"{field} {value!r} contains control characters")
+        values[field] = value
+    try:
+        price = float(row.get('price'))
+    except (TypeError, ValueError):
+        raise RowError(f"price {row.get('price')!r} is not a number")
+    if not math.isfinite(price) or price < 0:
+        raise RowError(f"price {price} must be zero or more")
+    values['price'] = price
+
+    image = str(row.get('image') or '').strip()
+    if image and not image.lower().endswith(image_extensions):
+        raise RowError(f"image {image!r} is not a {'/'.join(image_extensions)} file")
+    values['image'] = image or None
+    return values
+
+
+def iter_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(FIELDS)
+    for count, row in enumerate(rows, 1):
+        writer.writerow([row[field] if row[field] is not None else '' for field in FIELDS])
+        if count % 200 == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_json(rows):
+    yield '['
+    separator = '\n'
+    for row in rows:
+        yield separator + json.dumps({field: row[field] for field in FIELDS}, ensure_ascii=False)
+        separator = ',\n'
+    yield '\n]\n'
+
+
+def write_rows(rows, fmt):
+    """Chunks of text for the rows in fmt, for a streamed response or a file."""
+    return iter_csv(rows) if fmt == 'csv' else iter_json(rows)
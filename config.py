@@ -3,8 +3,38 @@ BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY', 'change-this-secret')
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(BASE_DIR, 'restaurant.db')
+    # Relative sqlite paths live in the instance folder (instance/restaurant.db)
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'sqlite:///restaurant.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    UPLOAD_FOLDER = os.path.join(BASE_DIR, 'static', 'uploads')
+    UPLOAD_FOLDER = os.path.join(BASE_DIR, 'static', 'images')
+    LEGACY_UPLOAD_FOLDER = os.path.join(BASE_DIR, 'static', 'uploads')  # older uploads, still used as image sources
     QRCODE_FOLDER = os.path.join(BASE_DIR, 'static', 'qrcodes')
+    BILLS_FOLDER = os.path.join(BASE_DIR, 'static', 'bills')
+    BASE_HOST_FOR_QR = os.environ.get('BASE_HOST_FOR_QR', 'http://192.168.29.118:5000')  # LAN host in table QR codes
     BILL_WIDTH_MM = int(os.environ.get('BILL_WIDTH_MM', 80))  # thermal width default 80 mm
+    BILL_RENDERER = os.environ.get('BILL_RENDERER', 'pdfkit')  # 'pdfkit' or 'native' (receipt.py)
+    CART_STORE = os.environ.get('CART_STORE', 'memory')  # 'memory' or 'sqlite' (instance/carts.db)
+    CART_SCOPE = os.environ.get('CART_SCOPE', 'table')  # 'table' = shared by everyone at the table, 'device'
+    CART_TTL = int(os.environ.get('CART_TTL', 4 * 3600))  # seconds before an untouched cart is dropped
+    CART_DB_PATH = os.environ.get('CART_DB_PATH')  # sqlite cart store file, default instance/carts.db
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+    DB_POOL_OVERFLOW = int(os.environ.get('DB_POOL_OVERFLOW', 20))
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+    # Needed once there is more than one worker: redis://host:6379/0, or
+    # sqlite:///path/to/queue.db for a single machine. Unset = in-process.
+    SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE')
+    # Without sticky sessions every worker must be reached over one websocket
+    SOCKETIO_TRANSPORTS = os.environ.get('SOCKETIO_TRANSPORTS', 'polling,websocket').split(',')
+    CATALOG_IMPORT_CHUNK = int(os.environ.get('CATALOG_IMPORT_CHUNK', 500))  # rows per import transaction
+    MENU_PAGE_SIZE = int(os.environ.get('MENU_PAGE_SIZE', 48))  # dishes per customer menu page
+    MENU_FRAGMENT_CACHE = os.environ.get('MENU_FRAGMENT_CACHE', '1') == '1'  # reuse rendered category blocks
+    SLOW_REQUEST_MS = int(os.environ.get('SLOW_REQUEST_MS', 0))  # log slower requests with their SQL; 0 = off
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  # bearer token a Prometheus scraper can use for /admin/metrics
+    PASSWORD_HASH_ITERATIONS = int(os.environ.get('PASSWORD_HASH_ITERATIONS', 600000))  # PBKDF2-SHA256 work factor
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 60))  # seconds load_user() reuses a user; 0 = off
+    LOGIN_RATE_BURST = int(os.environ.get('LOGIN_RATE_BURST', 5))  # login attempts per IP before throttling
+    LOGIN_RATE_PER_MINUTE = float(os.environ.get('LOGIN_RATE_PER_MINUTE', 5))  # attempts regained per minute
+    # `flask archive-orders` (scheduled by gunicorn.conf.py) moves older completed orders to the archive tables
+    ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', 90))
+    ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', 500))  # orders per write transaction
+    ARCHIVE_BATCH_PAUSE = float(os.environ.get('ARCHIVE_BATCH_PAUSE', 0.2))  # seconds between batches
@@ -0,0 +1,53 @@
+"""gunicorn settings for production: gunicorn -c gunicorn.conf.py wsgi:app
+
+WEB_CONCURRENCY sets the number of eventlet workers. With more than one,
+carts, SocketIO emits and socket connections are moved to shared backends
+below unless they were configured explicitly.
+"""
+import multiprocessing
+import os
+import subprocess
+import sys
+import threading
+import time
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+worker_class = 'eventlet'
+worker_connections = 1000
+timeout = 60
+
+if workers > 1:
+    os.environ.setdefault('CART_STORE', 'sqlite')
+    os.environ.setdefault('SOCKETIO_MESSAGE_QUEUE',
+                          'sqlite:///' + os.path.join(BASE_DIR, 'instance', 'socketio-queue.db'))
+    # gunicorn has no sticky sessions, so long-polling requests could land on
+    # another worker; a websocket stays on the worker it connected to
+    os.environ.setdefault('SOCKETIO_TRANSPORTS', 'websocket')
+
+# Hours between `flask archive-orders` runs (archive old orders, compact the DB); 0 = off
+MAINTENANCE_INTERVAL = float(os.environ.get('MAINTENANCE_INTERVAL_HOURS', 24)) * 3600
+MAINTENANCE_FIRST_DELAY = 600  # seconds after startup, out of the way of the boot
+
+
+def on_starting(server):
+    # Migrate once in a separate process, before any worker opens the database
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'wsgi', 'init-db'], cwd=BASE_DIR, check=True)
+
+
+def when_ready(server):
+    # The master runs maintenance, so it happens once however many workers there are
+    if MAINTENANCE_INTERVAL > 0:
+        threading.Thread(target=run_maintenance, args=(server,), daemon=True, name='maintenance').start()
+
+
+def run_maintenance(server):
+    time.sleep(min(MAINTENANCE_FIRST_DELAY, MAINTENANCE_INTERVAL))
+    while True:
+        result = subprocess.run([sys.executable, '-m', 'flask', '--app', 'wsgi', 'archive-orders'],
+                                cwd=BASE_DIR, capture_output=True, text=True)
+        for line in (result.stdout + result.stderr).splitlines():
+            server.log.info("archive-orders: %s", line)
+        time.sleep(MAINTENANCE_INTERVAL)
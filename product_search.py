@@ -0,0 +1,94 @@
+"""In-memory product search with category and price facets.
+
+The index is built from a catalog snapshot, so it is rebuilt whenever admin
+CRUD invalidates the catalog. Words in product names match by prefix ("pan"
+finds "Paneer Tikka"), case and accents ignored.
+"""
+import bisect
+import re
+import unicodedata
+from collections import namedtuple
+
+# (low, high) in rupees, high exclusive; None = open-ended
+PRICE_RANGES = ((0, 100), (100, 200), (200, 300), (300, 500), (500, None))
+
+SearchResult = namedtuple('SearchResult', 'products total page pages per_page category_counts price_counts')
+
+_WORD = re.compile(r'\w+')
+
+
+def tokenize(text):
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch)).lower()
+    return _WORD.findall(text)
+
+
+def in_price_range(price, low, high):
+    return (low is None or price >= low) and (high is None or price < high)
+
+
+class SearchIndex:
+    def __init__(self, products):
+        """products: catalog items with id, name, price and category_id, in display order."""
+        self.products = list(products)
+        postings = {}
+        for position, product in enumerate(self.products):
+            for token in tokenize(product.name):
+                postings.setdefault(token, set()).add(position)
+        self._terms = sorted(postings)
+        self._postings = [frozenset(postings[term]) for term in self._terms]
+        self._first_words = [(tokenize(product.name) or [''])[0] for product in self.products]
+        self._price_ranges = [next((i for i, (low, high) in enumerate(PRICE_RANGES)
+                                    if in_price_range(product.price or 0, low, high)), None)
+                              for product in self.products]
+
+    def _prefix_matches(self, prefix):
+        # Terms sharing the prefix are adjacent in the sorted term list
+        start = bisect.bisect_left(self._terms, prefix)
+        end = bisect.bisect_left(self._terms, prefix + '\uffff', start)
+        if end - start == 1:
+            return self._postings[start]
+        return frozenset().union(*self._postings[start:end])
+
+    def match(self, query):
+        """Positions of products whose name has a word starting with every query word."""
+        words = tokenize(query)
+        if not words:
+            return range(len(self.products))
+        matches = None
+        for word in sorted(set(words), key=len, reverse=True):  # longest is usually rarest
+            positions = self._prefix_matches(word)
+            matches = positions if matches is None else matches & positions
+            if not matches:
+                return []
+        # Names starting with the first query word come first, then display order
+        lead = words[0]
+        return sorted(matches, key=lambda p: (not self._first_words[p].startswith(lead), p))
+
+    def search(self, query='', category_id=None, min_price=None, max_price=None, page=1, per_page=24):
+        """One page of matches plus facet counts.
+
+        Category counts ignore the category filter and price counts ignore the
+        price filter, so each facet shows what choosing another value gives.
+        """
+        products, price_ranges = self.products, self._price_ranges
+        low = float('-inf') if min_price is None else min_price
+        high = float('inf') if max_price is None else max_price
+        category_counts, price_counts = {}, [0] * len(PRICE_RANGES)
+        results = []
+        for position in self.match(query):
+            product = products[position]
+            in_price = low <= (product.price or 0) < high
+            if in_price:
+                category_counts[product.category_id] = category_counts.get(product.category_id, 0) + 1
+            if category_id is None or product.category_id == category_id:
+                if price_ranges[position] is not None:
+                    price_counts[price_ranges[position]] += 1
+                if in_price:
+                    results.append(product)
+
+        total = len(results)
+        pages = max((total + per_page - 1) // per_page, 1)
+        page = min(max(page, 1), pages)
+        return SearchResult(results[(page - 1) * per_page:page * per_page], total, page, pages, per_page,
+                            category_counts, price_counts)
@@ -0,0 +1,212 @@
+"""Native thermal receipt rendering for bills.
+
+Lays out the same data as templates/bill.html directly as plain text,
+ESC/POS bytes or a 1-bit raster image sized for the printer's paper width,
+so printing a receipt needs neither wkhtmltopdf nor an HTML pass.
+"""
+import io
+from collections import namedtuple
+from functools import lru_cache
+
+from PIL import Image, ImageDraw, ImageFont
+
+RESTAURANT_NAME = 'INH Restaurant'
+HEADER_LINES = ['123 Main Street, Kolkata', 'Phone: +91-9065860876']
+FOOTER_LINES = ['Thank you for dining with us!', 'We hope to see you again soon.']
+CURRENCY = 'Rs.'  # the rupee sign is missing from printer code pages and the default font
+
+DOTS_PER_MM = 8     # 203 dpi print heads
+MARGIN_MM = 4       # unprintable edge on each side of the paper
+FONT_A_WIDTH = 12   # ESC/POS font A cell is 12x24 dots
+LINE_SPACING = 4    # extra pixels between raster lines
+RASTER_FONT_SIZE = 22
+
+ReceiptItem = namedtuple('ReceiptItem', 'name qty amount')
+Receipt = namedtuple('Receipt', 'order_id table created_at items total')
+
+# (content type, file extension) per output format
+RECEIPT_FORMATS = {
+    'text': ('text/plain; charset=utf-8', 'txt'),
+    'escpos': ('application/octet-stream', 'bin'),
+    'png': ('image/png', 'png'),
+    'pdf': ('application/pdf', 'pdf'),
+}
+
+
+def printable_dots(width_mm):
+    return max(width_mm - 2 * MARGIN_MM, 16) * DOTS_PER_MM
+
+
+def chars_per_line(width_mm):
+    return printable_dots(width_mm) // FONT_A_WIDTH
+
+
+def money(amount):
+    return f"{CURRENCY} {amount:.2f}"
+
+
+def _wrap(text, width, measure):
+    """Greedy word wrap where measure(text) <= width decides what fits."""
+    lines, current = [], ''
+    for word in text.split():
+        candidate = f"{current} {word}" if current else word
+        if measure(candidate) <= width:
+            current = candidate
+            continue
+        if current:
+            lines.append(current)
+        # A single word wider than the paper gets hard-split
+        while measure(word) > width and len(word) > 1:
+            cut = len(word) - 1
+            while cut > 1 and measure(word[:cut]) > width:
+                cut -= 1
+            lines.append(word[:cut])
+            word = word[cut:]
+        current = word
+    if current:
+        lines.append(current)
+    return lines or ['']
+
+
+def layout(receipt, width, measure):
+    """Return rows of (kind, left, right, bold) for the given line width.
+
+    kind is 'center', 'row', 'rule' or 'blank'; measure gives the width of a
+    string in the same unit as width (characters or pixels).
+    """
+    rows = []
+
+    def center(text, bold=False):
+        rows.extend(('center', line, '', bold) for line in _wrap(text, width, measure))
+
+    def row(left, right, bold=False):
+        if measure(f"{left} {right}") <= width:
+            rows.append(('row', left, right, bold))
+            return
+        rows.extend(('row', line, '', bold) for line in _wrap(left, width, measure))
+        rows.append(('row', '', right, bold))
+
+    center(RESTAURANT_NAME, bold=True)
+    for line in HEADER_LINES:
+        center(line)
+    center(f"Date: {receipt.created_at.strftime('%Y-%m-%d %H:%M')}")
+    rows.append(('rule', '', '', False))
+    row(f"Order #{receipt.order_id}", receipt.table)
+    rows.append(('rule', '', '', False))
+    for item in receipt.items:
+        row(item.name, f"x{item.qty}  {item.amount:.2f}")
+    rows.append(('rule', '', '', False))
+    row('TOTAL', money(receipt.total), bold=True)
+    rows.append(('blank', '', '', False))
+    for line in FOOTER_LINES:
+        center(line)
+    return rows
+
+
+def render_text(receipt, width_mm):
+    width = chars_per_line(width_mm)
+    lines = []
+    for kind, left, right, _ in layout(receipt, width, len):
+        if kind == 'center':
+            lines.append(left.center(width).rstrip())
+        elif kind == 'rule':
+            lines.append('-' * width)
+        elif kind == 'row':
+            lines.append((left + ' ' * (width - len(left) - len(right)) + right).rstrip())
+        else:
+            lines.append('')
+    return '\n'.join(lines) + '\n'
+
+
+def render_escpos(receipt, width_mm):
+    width = chars_per_line(width_mm)
+    out = bytearray(b'\x1b@')  # initialize printer
+    for kind, left, right, bold in layout(receipt, width, len):
+        out += b'\x1ba\x01' if kind == 'center' else b'\x1ba\x00'
+        if bold:
+            out += b'\x1bE\x01'
+        if kind == 'rule':
+            line = '-' * width
+        elif kind == 'row':
+            line = left + ' ' * (width - len(left) - len(right)) + right
+        else:
+            line = left
+        out += line.encode('cp437', errors='replace') + b'\n'
+        if bold:
+            out += b'\x1bE\x00'
+    out += b'\n\n\n\x1dV\x00'  # feed past the cutter, full cut
+    return bytes(out)
+
+
+@lru_cache(maxsize=None)
+def raster_font():
+    try:
+        return ImageFont.load_default(size=RASTER_FONT_SIZE)
+    except TypeError:  # Pillow < 10.1 only has the small bitmap font
+        return ImageFont.load_default()
+
+
+@lru_cache(maxsize=1024)
+def _glyph(char):
+    """(mask, advance) for one character, rasterized once per process.
+
+    Rendering through FreeType costs about as much per call as per glyph,
+    so receipts are composed from cached glyph masks instead.
+    """
+    font = raster_font()
+    right, bottom = font.getbbox(char)[2:]
+    mask = Image.new('L', (max(right, 1), max(bottom, 1)), 0)
+    ImageDraw.Draw(mask).text((0, 0), char, font=font, fill=255)
+    return mask, font.getlength(char)
+
+
+def text_width(text):
+    return sum(_glyph(char)[1] for char in text)
+
+
+def _draw_text(image, x, y, text):
+    for char in text:
+        mask, advance = _glyph(char)
+        if not char.isspace():
+            image.paste(0, (round(x), y), mask)
+        x += advance
+
+
+def render_image(receipt, width_mm):
+    """1-bit raster of the receipt, one pixel per printer dot."""
+    width = printable_dots(width_mm)
+    line_height = raster_font().getbbox('Ag')[3] + LINE_SPACING
+    rows = layout(receipt, width, text_width)
+
+    image = Image.new('1', (width, line_height * len(rows) + LINE_SPACING), 1)
+    draw = ImageDraw.Draw(image)
+    y = LINE_SPACING
+    for kind, left, right, bold in rows:
+        # Offset re-draw is a cheap bold for bitmap fonts
+        for dx in ((0, 1) if bold else (0,)):
+            if kind == 'center':
+                _draw_text(image, (width - text_width(left)) / 2 + dx, y, left)
+            elif kind == 'row':
+                _draw_text(image, dx, y, left)
+                _draw_text(image, width - text_width(right) - 1 + dx, y, right)
+        if kind == 'rule':
+            draw.line((0, y + line_height // 2, width, y + line_height // 2), fill=0)
+        y += line_height
+    return image
+
+
+def render(receipt, fmt, width_mm):
+    """Render receipt as bytes in one of RECEIPT_FORMATS."""
+    if fmt == 'text':
+        return render_text(receipt, width_mm).encode('utf-8')
+    if fmt == 'escpos':
+        return render_escpos(receipt, width_mm)
+    if fmt in ('png', 'pdf'):
+        buffer = io.BytesIO()
+        image = render_image(receipt, width_mm)
+        if fmt == 'png':
+            image.save(buffer, 'PNG', optimize=False)
+        else:
+            image.save(buffer, 'PDF', resolution=DOTS_PER_MM * 25.4)
+        return buffer.getvalue()
+    raise ValueError(f"Unknown receipt format: {fmt}")
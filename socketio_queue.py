@@ -0,0 +1,60 @@
+"""SQLite-backed message queue for Flask-SocketIO on a single machine.
+
+Every worker appends its emits to a shared table and polls it for the
+others', which is what RedisManager does over pub/sub. Good enough for a
+handful of workers on one box without running Redis.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+import socketio
+
+POLL_INTERVAL = 0.05  # seconds between polls while the queue is idle
+RETENTION = 60        # seconds a message is kept for slow readers
+PRUNE_INTERVAL = 10
+
+
+class SQLiteManager(socketio.PubSubManager):
+    name = 'sqlite'
+
+    def __init__(self, url='sqlite:///socketio-queue.db', channel='flask-socketio', write_only=False,
+                 logger=None, json=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger, json=json)
+        self.path = url[len('sqlite:///'):] if url.startswith('sqlite:///') else url
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        # Publishing happens from every request, so it shares one connection
+        self._publish_lock = threading.Lock()
+        self._publish_conn = self._connect()
+        self._publish_conn.execute("PRAGMA journal_mode=WAL")
+        self._publish_conn.execute("""CREATE TABLE IF NOT EXISTS socketio_message (
+                                          id INTEGER PRIMARY KEY AUTOINCREMENT,
+                                          channel TEXT NOT NULL,
+                                          payload TEXT NOT NULL,
+                                          created_at REAL NOT NULL)""")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+
+    def _publish(self, data):
+        with self._publish_lock:
+            self._publish_conn.execute(
+                "INSERT INTO socketio_message (channel, payload, created_at) VALUES (?, ?, ?)",
+                (self.channel, self.json.dumps(data), time.time()))
+
+    def _listen(self):
+        conn = self._connect()
+        last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM socketio_message").fetchone()[0]
+        next_prune = 0
+        while True:
+            rows = conn.execute("SELECT id, payload FROM socketio_message WHERE id > ? AND channel = ? "
+                                "ORDER BY id", (last_id, self.channel)).fetchall()
+            for last_id, payload in rows:
+                yield payload
+            now = time.time()
+            if now >= next_prune:
+                next_prune = now + PRUNE_INTERVAL
+                conn.execute("DELETE FROM socketio_message WHERE created_at < ?", (now - RETENTION,))
+            if not rows:
+                self.server.sleep(POLL_INTERVAL)
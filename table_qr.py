@@ -0,0 +1,77 @@
+"""QR code images for the per-table menu links.
+
+Kept free of app imports so the functions can run in a process pool
+without each worker loading Flask and the database.
+"""
+import hashlib
+import io
+
+import qrcode
+import qrcode.image.svg
+from PIL import Image, ImageDraw, ImageFont
+
+QR_FORMATS = {'png': 'image/png', 'svg': 'image/svg+xml'}
+
+# QR sheet layout: A4 at 150 dpi, 3 x 4 codes per page
+SHEET_DPI = 150
+SHEET_SIZE = (1240, 1754)
+SHEET_COLUMNS = 3
+SHEET_ROWS = 4
+SHEET_MARGIN = 60
+LABEL_HEIGHT = 50
+
+
+def url_digest(url):
+    return hashlib.sha1(url.encode('utf-8')).hexdigest()[:16]
+
+
+def make_qr(url, fmt='png'):
+    """Encode url as a QR image and return the file bytes."""
+    qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_H, box_size=6, border=4)
+    qr.add_data(url)
+    qr.make(fit=True)
+    buffer = io.BytesIO()
+    if fmt == 'svg':
+        qr.make_image(image_factory=qrcode.image.svg.SvgPathImage).save(buffer)
+    else:
+        qr.make_image(fill_color="black", back_color="white").save(buffer)
+    return buffer.getvalue()
+
+
+def sheet_digest(entries):
+    return url_digest('\n'.join(f"{label}\t{url}" for label, url in entries))
+
+
+def build_qr_sheet(entries, executor=None):
+    """Lay out [(label, url), ...] as a printable multi-page PDF.
+
+    The QR codes are encoded through executor.map when an executor is given.
+    """
+    mapper = executor.map if executor else map
+    codes = list(mapper(make_qr, [url for _, url in entries]))
+
+    try:
+        font = ImageFont.load_default(size=32)
+    except TypeError:  # Pillow < 10.1
+        font = ImageFont.load_default()
+    cell_w = (SHEET_SIZE[0] - 2 * SHEET_MARGIN) // SHEET_COLUMNS
+    cell_h = (SHEET_SIZE[1] - 2 * SHEET_MARGIN) // SHEET_ROWS
+    side = min(cell_w, cell_h - LABEL_HEIGHT) - 20
+    per_page = SHEET_COLUMNS * SHEET_ROWS
+
+    pages = []
+    for start in range(0, max(len(entries), 1), per_page):
+        page = Image.new('L', SHEET_SIZE, 255)
+        draw = ImageDraw.Draw(page)
+        for i, ((label, _), code) in enumerate(zip(entries[start:start + per_page], codes[start:start + per_page])):
+            x = SHEET_MARGIN + (i % SHEET_COLUMNS) * cell_w
+            y = SHEET_MARGIN + (i // SHEET_COLUMNS) * cell_h
+            qr_image = Image.open(io.BytesIO(code)).convert('L').resize((side, side), Image.NEAREST)
+            page.paste(qr_image, (x + (cell_w - side) // 2, y))
+            draw.text((x + (cell_w - draw.textlength(label, font=font)) / 2, y + side + 10),
+                      label, font=font, fill=0)
+        pages.append(page)
+
+    buffer = io.BytesIO()
+    pages[0].save(buffer, 'PDF', save_all=True, append_images=pages[1:], resolution=SHEET_DPI)
+    return buffer.getvalue()
@@ -0,0 +1,106 @@
+"""The order listings must not issue a query per order or per item.
+
+Each page is requested against a small and a large order history; the
+statement count has to be the same for both.
+"""
+import re
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import event
+
+from app import create_app, db, User, Category, Product, Table, Order, OrderItem, local_now, ORDERS_PER_PAGE
+from config import Config
+
+TABLES = 4
+SMALL, LARGE = ORDERS_PER_PAGE + 10, ORDERS_PER_PAGE * 4
+
+
+@pytest.fixture(scope='module')
+def app(tmp_path_factory):
+    tmp = tmp_path_factory.mktemp('orders')
+
+    class TestConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp / 'test.db'}"
+        PASSWORD_HASH_ITERATIONS = 1000
+        CART_STORE = 'memory'
+        SOCKETIO_MESSAGE_QUEUE = None
+
+    app = create_app(TestConfig, instance_path=str(tmp / 'instance'))
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+def seed(orders):
+    """orders orders with 1-4 items each, spread over TABLES tables and every status."""
+    db.drop_all()
+    db.create_all()
+    user = User(username='owner')
+    user.set_password('owner')
+    db.session.add(user)
+    category = Category(name='Starters')
+    db.session.add(category)
+    db.session.flush()
+    db.session.add_all(Table(name=f'T{i + 1}') for i in range(TABLES))
+    db.session.add_all(Product(name=f'P{i}', price=10.0 + i, category_id=category.id) for i in range(8))
+    db.session.commit()
+
+    now = local_now()
+    statuses = ['pending', 'preparing', 'served', 'completed']
+    db.session.execute(Order.__table__.insert(), [
+        {'id': i, 'table_id': i % TABLES + 1, 'status': statuses[i % len(statuses)],
+         'created_at': now - timedelta(hours=orders - i)}
+        for i in range(1, orders + 1)])
+    db.session.execute(OrderItem.__table__.insert(), [
+        {'order_id': i, 'product_id': pid, 'qty': 2, 'price': 2 * (10.0 + pid - 1)}
+        for i in range(1, orders + 1) for pid in range(1, i % 4 + 2)])
+    db.session.commit()
+
+
+def count_queries(client, url):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        response = client.get(url)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    assert response.status_code == 200, url
+    return len(statements)
+
+
+def page_query_counts(app, orders):
+    with app.app_context():
+        seed(orders)
+        client = app.test_client()
+        client.post('/admin/login', data={'username': 'owner', 'password': 'owner'})
+        today = local_now().date()
+        urls = ['/admin/orders',
+                '/admin/orders?status=completed',
+                '/admin/orders?status=pending',
+                f'/admin/orders?date_from={today - timedelta(days=30)}&date_to={today}']
+        first_page = client.get('/admin/orders').get_data(as_text=True)
+        cursor = re.search(r'cursor=([^"&]+)', first_page)
+        assert cursor, "the first page links to the next one"
+        urls.append(f'/admin/orders?cursor={cursor.group(1)}')
+        urls += [f'/my_orders/{table_id}' for table_id in range(1, TABLES + 1)]
+
+        counts = {}
+        for url in urls:
+            client.get(url)  # warm-up: the user cache and catalog are loaded once per process
+            counts[url.replace(cursor.group(1), '<cursor>')] = count_queries(client, url)
+        return counts
+
+
+def test_order_listings_use_constant_queries(app):
+    small = page_query_counts(app, SMALL)
+    large = page_query_counts(app, LARGE)
+    assert small == large
+    for url, count in large.items():
+        limit = 1 if url.startswith('/admin/orders') else 4
+        assert count <= limit, f"{url}: {count} queries"